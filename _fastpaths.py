@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Ahead-of-time build of the impedance_comparison_gui kernels
+
+Run once (needs numba and a C compiler):
+    python _fastpaths.py
+This writes the impedance_fast extension module next to this file. When it
+is importable, impedance_comparison_gui uses it instead of numpy; importing
+it does not load numba.
+"""
+
+import os
+
+from numba.pycc import CC
+
+import impedance_comparison_gui as gui
+
+cc = CC('impedance_fast')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+cc.export('interp2', 'UniTuple(f8[:], 2)(f8[:], f8[:], f8[:], f8[:])')(gui._interp2_kernel)
+cc.export('error_stats', 'UniTuple(f8, 3)(f8[:])')(gui._error_stats_kernel)
+
+
+if __name__ == "__main__":
+    cc.compile()
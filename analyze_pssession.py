@@ -3,200 +3,684 @@
 Analyze PS Trace .pssession file structure
 """
 
-import json
+import codecs
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import pickle
 import sys
+from collections import deque
+from itertools import islice
+
+from typing import Any, Callable, Dict, List, Tuple
+
+try:
+    import ijson  # type: ignore  # Optional: streams the document instead of loading it whole
+except ImportError:
+    ijson = None
+
+try:
+    import orjson  # Optional: faster parser for fully loaded documents
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    from mypy_extensions import mypyc_attr  # Only needed when compiling with mypyc
+except ImportError:
+    def mypyc_attr(*attrs, **kwattrs):  # type: ignore
+        return lambda cls: cls
+
+PARSE_ERRORS: Tuple[type, ...] = (ValueError, UnicodeError)
+if ijson is not None:
+    PARSE_ERRORS += (ijson.JSONError,)
+
+# Structure reports are cached here, keyed by file path, mtime and size
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'biopal-esp')
+CACHE_VERSION = 2  # Bump when the report format changes
+
+# Suffix of the UTF-8 copy written by --normalize
+NORMALIZED_SUFFIX = '.utf8.json'
+
+MAX_KEYS = 10   # Dict keys shown per level by analyze_value
+MAX_ITEMS = 3   # List items shown per level by analyze_value
+
+# Indent strings by depth, so analyze_value does not rebuild them per node
+_INDENTS: List[str] = ["  " * d for d in range(16)]
+
+# analyze_value work stack: output pieces or (value, depth) frames to expand
+_Stack = deque  # deque[Union[str, Tuple[Any, int]]]
+
+def _fmt_dict(val: Any, indent: str, depth: int, out: List[str], stack: _Stack) -> None:
+    out.append(f"{indent}{{\n")
+    pieces: List[Any] = []
+    for key, value in islice(val.items(), MAX_KEYS):  # Show first 10 keys
+        pieces += (f"{indent}  '{key}': ", (value, depth+1), "\n")
+    if len(val) > MAX_KEYS:
+        pieces.append(f"{indent}  ... ({len(val) - MAX_KEYS} more keys)\n")
+    pieces.append(f"{indent}}}")
+    stack.extend(reversed(pieces))
+
+def _fmt_list(val: Any, indent: str, depth: int, out: List[str], stack: _Stack) -> None:
+    if len(val) == 0:
+        out.append("[]")
+        return
+    out.append("[\n")
+    pieces: List[Any] = []
+    # Show first few items
+    num_to_show = min(MAX_ITEMS, len(val))
+    for i in range(num_to_show):
+        pieces += (f"{indent}  [{i}]: ", (val[i], depth+1), "\n")
+    if len(val) > num_to_show:
+        pieces.append(f"{indent}  ... ({len(val) - num_to_show} more items)\n")
+    pieces.append(f"{indent}]")
+    stack.extend(reversed(pieces))
+
+def _fmt_str(val: Any, indent: str, depth: int, out: List[str], stack: _Stack) -> None:
+    if len(val) > 50:
+        out.append(f'"{val[:50]}..." (len={len(val)})')
+    else:
+        out.append(f'"{val}"')
 
-def analyze_value(val, depth=0, max_depth=5):
-    """Recursively analyze a value and return its structure"""
-    indent = "  " * depth
+def _fmt_scalar(val: Any, indent: str, depth: int, out: List[str], stack: _Stack) -> None:
+    out.append(str(val))
 
-    if depth > max_depth:
-        return f"{indent}[max depth reached]"
-
-    if isinstance(val, dict):
-        result = f"{indent}{{\n"
-        for i, (key, value) in enumerate(list(val.items())[:10]):  # Show first 10 keys
-            result += f"{indent}  '{key}': {analyze_value(value, depth+1, max_depth)}\n"
-        if len(val) > 10:
-            result += f"{indent}  ... ({len(val) - 10} more keys)\n"
-        result += f"{indent}}}"
-        return result
-    elif isinstance(val, list):
-        if len(val) == 0:
-            return "[]"
-        result = f"[\n"
-        # Show first few items
-        num_to_show = min(3, len(val))
-        for i in range(num_to_show):
-            result += f"{indent}  [{i}]: {analyze_value(val[i], depth+1, max_depth)}\n"
-        if len(val) > num_to_show:
-            result += f"{indent}  ... ({len(val) - num_to_show} more items)\n"
-        result += f"{indent}]"
-        return result
-    elif isinstance(val, str):
-        if len(val) > 50:
-            return f'"{val[:50]}..." (len={len(val)})'
-        return f'"{val}"'
-    elif isinstance(val, (int, float)):
-        return str(val)
-    elif isinstance(val, bool):
-        return str(val)
-    elif val is None:
-        return "null"
-    else:
-        return f"<{type(val).__name__}>"
+def _fmt_null(val: Any, indent: str, depth: int, out: List[str], stack: _Stack) -> None:
+    out.append("null")
 
-def analyze_pssession(filepath):
-    """Analyze .pssession file structure"""
-    print(f"Analyzing: {filepath}\n")
+def analyze_value(val: Any, depth: int = 0, max_depth: int = 5) -> str:
+    """Analyze a value and return its structure
 
-    # First, read binary to check for BOM
-    with open(filepath, 'rb') as f:
-        raw_bytes = f.read()
+    Walks the tree with an explicit work stack instead of recursion. Stack
+    entries are either output pieces (str) or (value, depth) frames still to
+    expand; children are pushed in reverse so output order is preserved.
+    """
+    out: List[str] = []
+    stack: _Stack = deque([(val, depth)])
 
-    print(f"File size: {len(raw_bytes)} bytes")
-    print(f"First 20 bytes: {raw_bytes[:20].hex()}")
-    print(f"First 20 bytes (repr): {repr(raw_bytes[:20])}")
-    print()
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            out.append(item)
+            continue
 
-    # Try reading with different encodings
-    encodings = ['utf-16-le', 'utf-16', 'utf-8', 'utf-8-sig']
+        val, depth = item
+        indent = _INDENTS[depth] if depth < len(_INDENTS) else "  " * depth
 
-    for encoding in encodings:
-        try:
-            print(f"Trying encoding: {encoding}")
-            with open(filepath, 'r', encoding=encoding) as f:
-                content = f.read()
-
-            # Strip BOM if present
-            if content.startswith('\ufeff'):
-                print("  Stripping BOM...")
-                content = content[1:]
-
-            # Show first 500 characters
-            print(f"\nFirst 500 characters:")
-            print(repr(content[:500]))
-            print()
-
-            # Try to parse as JSON - might be multiple objects
-            print(f"Attempting to parse JSON...")
-
-            # First try as single object
-            try:
-                data = json.loads(content)
-            except json.JSONDecodeError as e:
-                if "Extra data" in str(e):
-                    # Try to parse multiple JSON objects
-                    print(f"  Found extra data at position {e.pos}")
-                    print(f"  Trying to parse first JSON object only...")
-
-                    # Use JSONDecoder to get just the first object
-                    decoder = json.JSONDecoder()
-                    data, idx = decoder.raw_decode(content)
-
-                    print(f"  ✓ Successfully parsed first JSON object (ends at position {idx})")
-                    print(f"  Content after JSON object ({len(content) - idx} chars):")
-                    print(repr(content[idx:idx+200]))
-                else:
-                    raise
+        if depth > max_depth:
+            out.append(f"{indent}[max depth reached]")
+            continue
 
-            print(f"✓ Successfully loaded with encoding: {encoding}\n")
-            print("="*80)
-            print("JSON STRUCTURE")
-            print("="*80)
-
-            # Print top-level keys and types
-            print(f"\nTop-level type: {type(data).__name__}")
-
-            if isinstance(data, dict):
-                print(f"Number of top-level keys: {len(data)}")
-                print("\nTop-level keys:")
-                for key in data.keys():
-                    val_type = type(data[key]).__name__
-                    if isinstance(data[key], list):
-                        val_type += f" (length={len(data[key])})"
-                    elif isinstance(data[key], dict):
-                        val_type += f" (keys={len(data[key])})"
-                    print(f"  - {key}: {val_type}")
-
-            print("\n" + "="*80)
-            print("DETAILED STRUCTURE")
-            print("="*80)
-            print(analyze_value(data, depth=0, max_depth=4))
-
-            print("\n" + "="*80)
-            print("SPECIFIC DATA ANALYSIS")
-            print("="*80)
-
-            # Look for measurements
-            if 'measurements' in data:
-                measurements = data['measurements']
-                print(f"\nNumber of measurements: {len(measurements)}")
-
-                if len(measurements) > 0:
-                    print(f"\nFirst measurement structure:")
-                    first_meas = measurements[0]
-
-                    if isinstance(first_meas, dict):
-                        for key, val in first_meas.items():
-                            if key == 'dataset' and isinstance(val, list):
-                                print(f"  {key}: list with {len(val)} arrays")
-                                for i, arr in enumerate(val[:5]):  # Show first 5
-                                    if isinstance(arr, dict):
-                                        arr_type = arr.get('type', 'unknown')
-                                        x_label = arr.get('xaxislabel', 'unknown')
-                                        y_label = arr.get('yaxislabel', 'unknown')
-                                        num_points = len(arr.get('xvalues', []))
-                                        print(f"    [{i}] {y_label} vs {x_label} ({num_points} points) - type: {arr_type}")
-                            else:
-                                val_str = str(val)
-                                if len(val_str) > 100:
-                                    val_str = val_str[:100] + "..."
-                                print(f"  {key}: {val_str}")
-
-            # Look for method
-            if 'methodformeasurement' in data:
-                print(f"\n\nMethod for measurement:")
-                method = data['methodformeasurement']
-                if isinstance(method, dict):
-                    for key, val in list(method.items())[:20]:  # Show first 20 keys
+        # JSON values have exact types, so one dict lookup replaces the isinstance chain
+        handler = _DISPATCH.get(type(val))
+        if handler is not None:
+            handler(val, indent, depth, out, stack)
+        else:
+            out.append(f"<{type(val).__name__}>")
+
+    return "".join(out)
+
+@mypyc_attr(native_class=False)
+class SketchDict(dict):
+    """Dict holding only the retained keys of a larger JSON object; len() is the full size"""
+    __slots__ = ('size',)
+
+    def __len__(self):
+        return self.size
+
+@mypyc_attr(native_class=False)
+class SketchList(list):
+    """List holding only the retained items of a larger JSON array; len() is the full size"""
+    __slots__ = ('size',)
+
+    def __len__(self):
+        return self.size
+
+# Formatter per exact value type, used by analyze_value
+_DISPATCH: Dict[type, Callable[[Any, str, int, List[str], _Stack], None]] = {
+    dict: _fmt_dict,
+    SketchDict: _fmt_dict,
+    list: _fmt_list,
+    SketchList: _fmt_list,
+    str: _fmt_str,
+    int: _fmt_scalar,
+    float: _fmt_scalar,
+    bool: _fmt_scalar,
+    type(None): _fmt_null,
+}
+
+def _json_type(val):
+    """Type of a value as it appears in the JSON document (sketches report as dict/list)"""
+    if type(val) is SketchDict:
+        return dict
+    if type(val) is SketchList:
+        return list
+    return type(val)
+
+# Retention decisions for streamed values
+_KEEP = 0         # Build the value
+_PLACEHOLDER = 1  # Count it and store None (below max depth)
+_DROP = 2         # Count it only
+
+class _Utf8Reader:
+    """Binary file wrapper that re-encodes the text to UTF-8 chunk by chunk,
+    dropping the BOM markers PS Trace writes around the JSON"""
+
+    def __init__(self, f, encoding):
+        self._f = f
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+
+    def read(self, size=-1):
+        # Keep reading until some text comes out; b'' means end of file
+        while True:
+            raw = self._f.read(size)
+            text = self._decoder.decode(raw, final=not raw).replace('\ufeff', '')
+            if text or not raw:
+                return text.encode('utf-8')
+
+def _retain(path, index, is_list, depth, max_depth):
+    """Decide whether a streamed value is needed by the structure report"""
+    # The first measurement is reported in full, except for sample-limited lists
+    if path[:2] == ('measurements', 0):
+        if not is_list or index < MAX_ITEMS or path[-1] == 'values':
+            return _KEEP
+        return _DROP
+
+    # Every top-level key is listed
+    if path == ():
+        return _KEEP
+
+    # Method parameters are listed up to 20 keys
+    if path == ('methodformeasurement',) and not is_list:
+        return _KEEP if index < 20 else _DROP
+
+    if index >= (MAX_ITEMS if is_list else MAX_KEYS):
+        return _DROP
+    if depth > max_depth:
+        return _PLACEHOLDER
+    return _KEEP
+
+def _skip_value(event, events):
+    """Consume the remaining events of a value that starts with `event`"""
+    if event != 'start_map' and event != 'start_array':
+        return
+    level = 1
+    for event, _ in events:
+        if event == 'start_map' or event == 'start_array':
+            level += 1
+        elif event == 'end_map' or event == 'end_array':
+            level -= 1
+            if level == 0:
+                return
+
+def _count_rest_of_array(event, events):
+    """Consume an array from item `event` through its end_array; returns the item count
+
+    Used once an array is past its retained items (e.g. long datavalues), so
+    the remaining values are only counted, never built or path-tracked.
+    """
+    count = 0
+    level = 0
+    while True:
+        if level == 0:
+            if event == 'end_array':
+                return count
+            count += 1
+        if event == 'start_map' or event == 'start_array':
+            level += 1
+        elif event == 'end_map' or event == 'end_array':
+            level -= 1
+        event = next(events)[0]
+
+def sketch_document(events, max_depth=4):
+    """Build a truncated copy of a JSON document from ijson basic_parse events
+
+    Containers are SketchDict/SketchList whose len() reports the full size,
+    so analyze_value and the report render them exactly like the full document.
+    """
+    stack = []  # Frames: [container, path, depth, pending key or None]
+
+    for event, value in events:
+        if event == 'map_key':
+            frame = stack[-1]
+            container = frame[0]
+            decision = _retain(frame[1], container.size, False, frame[2] + 1, max_depth)
+            container.size += 1
+            if decision == _DROP:
+                _skip_value(next(events)[0], events)
+            elif decision == _PLACEHOLDER:
+                _skip_value(next(events)[0], events)
+                container[value] = None
+            else:
+                frame[3] = value
+            continue
+
+        if event == 'end_map' or event == 'end_array':
+            container = stack.pop()[0]
+            if not stack:
+                return container
+            continue
+
+        # A value starts: decide where it goes
+        if stack:
+            frame = stack[-1]
+            parent, parent_path, depth = frame[0], frame[1], frame[2] + 1
+            if type(parent) is SketchList:
+                key = parent.size
+                decision = _retain(parent_path, key, True, depth, max_depth)
+                if decision == _DROP:
+                    # Later items are dropped too: count them in one tight pass
+                    parent.size += _count_rest_of_array(event, events)
+                    stack.pop()
+                    if not stack:
+                        return parent
+                    continue
+                parent.size += 1
+                if decision == _PLACEHOLDER:
+                    _skip_value(event, events)
+                    parent.append(None)
+                    continue
+            else:
+                key = frame[3]
+            path = parent_path + (key,)
+        else:
+            parent, depth, path = None, 0, ()
+
+        if event == 'start_map':
+            obj = SketchDict()
+        elif event == 'start_array':
+            obj = SketchList()
+        else:
+            obj = value
+
+        if parent is None:
+            if event != 'start_map' and event != 'start_array':
+                return obj
+        elif type(parent) is SketchList:
+            parent.append(obj)
+        else:
+            parent[key] = obj
+
+        if event == 'start_map' or event == 'start_array':
+            obj.size = 0
+            stack.append([obj, path, depth, None])
+
+    raise ValueError("Unexpected end of JSON document")
+
+def print_structure_report(data):
+    """Print the structure report for a parsed (or sketched) document"""
+    print("="*80)
+    print("JSON STRUCTURE")
+    print("="*80)
+
+    # Print top-level keys and types
+    print(f"\nTop-level type: {_json_type(data).__name__}")
+
+    if isinstance(data, dict):
+        print(f"Number of top-level keys: {len(data)}")
+        print("\nTop-level keys:")
+        for key in data.keys():
+            val_type = _json_type(data[key]).__name__
+            if isinstance(data[key], list):
+                val_type += f" (length={len(data[key])})"
+            elif isinstance(data[key], dict):
+                val_type += f" (keys={len(data[key])})"
+            print(f"  - {key}: {val_type}")
+
+    print("\n" + "="*80)
+    print("DETAILED STRUCTURE")
+    print("="*80)
+    print(analyze_value(data, depth=0, max_depth=4))
+
+    print("\n" + "="*80)
+    print("SPECIFIC DATA ANALYSIS")
+    print("="*80)
+
+    # Look for measurements
+    if 'measurements' in data:
+        measurements = data['measurements']
+        print(f"\nNumber of measurements: {len(measurements)}")
+
+        if len(measurements) > 0:
+            print(f"\nFirst measurement structure:")
+            first_meas = measurements[0]
+
+            if isinstance(first_meas, dict):
+                for key, val in first_meas.items():
+                    if key == 'dataset' and isinstance(val, list):
+                        print(f"  {key}: list with {len(val)} arrays")
+                        for i, arr in enumerate(val[:5]):  # Show first 5
+                            if isinstance(arr, dict):
+                                arr_type = arr.get('type', 'unknown')
+                                x_label = arr.get('xaxislabel', 'unknown')
+                                y_label = arr.get('yaxislabel', 'unknown')
+                                num_points = len(arr.get('xvalues', []))
+                                print(f"    [{i}] {y_label} vs {x_label} ({num_points} points) - type: {arr_type}")
+                    else:
                         val_str = str(val)
                         if len(val_str) > 100:
                             val_str = val_str[:100] + "..."
                         print(f"  {key}: {val_str}")
 
-            # Sample data values - explore dataset structure
-            print(f"\n\nDataset structure:")
-            if 'measurements' in data and len(data['measurements']) > 0:
-                first_meas = data['measurements'][0]
-                if 'dataset' in first_meas:
-                    dataset = first_meas['dataset']
-                    print(f"  Dataset type: {dataset.get('type')}")
+    # Look for method
+    if 'methodformeasurement' in data:
+        print(f"\n\nMethod for measurement:")
+        method = data['methodformeasurement']
+        if isinstance(method, dict):
+            for key, val in islice(method.items(), 20):  # Show first 20 keys
+                val_str = str(val)
+                if len(val_str) > 100:
+                    val_str = val_str[:100] + "..."
+                print(f"  {key}: {val_str}")
+
+    # Sample data values - explore dataset structure
+    print(f"\n\nDataset structure:")
+    if 'measurements' in data and len(data['measurements']) > 0:
+        first_meas = data['measurements'][0]
+        if 'dataset' in first_meas:
+            dataset = first_meas['dataset']
+            print(f"  Dataset type: {dataset.get('type')}")
+
+            if 'values' in dataset and isinstance(dataset['values'], list):
+                print(f"  Number of value arrays: {len(dataset['values'])}")
+
+                # Show structure of each array
+                for i, arr in enumerate(dataset['values']):
+                    if isinstance(arr, dict):
+                        arr_type = arr.get('type', 'unknown')
+                        arraytype = arr.get('arraytype', 'unknown')
+                        description = arr.get('description', 'unknown')
+                        unit = arr.get('unit', '')
+
+                        print(f"\n  Array [{i}]: {description} ({unit})")
+                        print(f"    type: {arr_type}")
+                        print(f"    arraytype: {arraytype}")
+
+                        # Show datavalues structure
+                        if 'datavalues' in arr and isinstance(arr['datavalues'], list):
+                            datavals = arr['datavalues']
+                            print(f"    datavalues: {len(datavals)} items")
+                            if len(datavals) > 0:
+                                print(f"      First 3 items: {datavals[:3]}")
+                                print(f"      Type of first item: {_json_type(datavals[0])}")
+
+def sketch_pssession(filepath, encoding):
+    """Sketch .pssession structure from an ijson event stream (flat memory use)"""
+    print(f"Streaming with encoding: {encoding}")
 
-                    if 'values' in dataset and isinstance(dataset['values'], list):
-                        print(f"  Number of value arrays: {len(dataset['values'])}")
+    with open(filepath, 'rb') as f:
+        events = iter(ijson.basic_parse(_Utf8Reader(f, encoding), use_float=True))
+        data = sketch_document(events, max_depth=4)
+
+    print(f"✓ Successfully streamed with encoding: {encoding}\n")
+    return data
+
+def _cache_path(filepath):
+    digest = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, f"{digest}.pkl")
+
+def load_cached_report(filepath, key):
+    """Return (encoding, report, summary) cached for this file version, or None"""
+    try:
+        with open(_cache_path(filepath), 'rb') as f:
+            cached_key, encoding, report, summary = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.PickleError):
+        return None
+    if cached_key != key:
+        return None
+    return encoding, report, summary
+
+def save_cached_report(filepath, key, encoding, report, summary):
+    """Cache the structure report; failures are ignored (the cache is optional)"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_cache_path(filepath), 'wb') as f:
+            pickle.dump((key, encoding, report, summary), f)
+    except OSError:
+        pass
+
+def summarize_structure(data, encoding):
+    """Small summary of a parsed or sketched document: top-level schema and data arrays"""
+    summary = {
+        'encoding': encoding,
+        'type': _json_type(data).__name__,
+        'keys': {},
+        'measurements': 0,
+        'arrays': [],
+    }
+    if not isinstance(data, dict):
+        return summary
+
+    for key, val in data.items():
+        size = len(val) if isinstance(val, (dict, list)) else None
+        summary['keys'][key] = (_json_type(val).__name__, size)
+
+    measurements = data.get('measurements')
+    if not isinstance(measurements, list) or len(measurements) == 0:
+        return summary
+    summary['measurements'] = len(measurements)
+
+    first_meas = measurements[0]
+    dataset = first_meas.get('dataset') if isinstance(first_meas, dict) else None
+    values = dataset.get('values') if isinstance(dataset, dict) else None
+    if isinstance(values, list):
+        for arr in values:
+            if isinstance(arr, dict):
+                datavals = arr.get('datavalues')
+                unit = arr.get('unit')
+                summary['arrays'].append({
+                    'description': arr.get('description'),
+                    'type': arr.get('type'),
+                    'arraytype': arr.get('arraytype'),
+                    'unit': dict(unit) if isinstance(unit, dict) else unit,
+                    'datavalues': len(datavals) if isinstance(datavals, list) else 0,
+                })
+    return summary
+
+def _report(data, filepath, key, encoding):
+    """Print the structure report, cache it for the next run and return the summary"""
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        print_structure_report(data)
+    report = report.getvalue()
+    print(report, end='')
+
+    summary = summarize_structure(data, encoding)
+    save_cached_report(filepath, key, encoding, report, summary)
+    return summary
+
+# Byte order marks, longest first (the UTF-32-LE BOM starts with the UTF-16-LE one)
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+def sniff_encoding(head):
+    """Pick the text encoding from the byte order mark; returns (encoding, BOM length)"""
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return 'utf-8', 0
+
+def decode_mapped(filepath, encoding, bom_len=0):
+    """Decode the whole file in a single pass straight from a read-only memory map"""
+    with open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm)[bom_len:] as view:
+                return codecs.decode(view, encoding)
+
+# Shared decoder for the stdlib fallback parse, created on first use so that
+# importing this module (or running --help) does not pull in json
+_DECODER = None
+
+def _json_decoder():
+    """Return the shared JSONDecoder, importing json on first call"""
+    global _DECODER
+    if _DECODER is None:
+        import json
+        _DECODER = json.JSONDecoder()
+    return _DECODER
+
+# Escapes for backslashes, control characters and the BOM in printed snippets
+_ESCAPE_TABLE = str.maketrans({chr(c): f'\\x{c:02x}' for c in range(32)})
+_ESCAPE_TABLE.update(str.maketrans({'\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t', '\ufeff': '\\ufeff'}))
+
+def _safe_snippet(s, start, n):
+    """Quoted slice of s with control characters escaped, cheaper than repr()"""
+    return f"'{s[start:start+n].translate(_ESCAPE_TABLE)}'"
+
+def parse_json_content(content):
+    """Parse the first JSON object in decoded .pssession text"""
+    # Strip BOM if present
+    if content.startswith('\ufeff'):
+        print("  Stripping BOM...")
+        content = content[1:]
+
+    # Show first 500 characters
+    print(f"\nFirst 500 characters:")
+    print(_safe_snippet(content, 0, 500))
+    print()
 
-                        # Show structure of each array
-                        for i, arr in enumerate(dataset['values']):
-                            if isinstance(arr, dict):
-                                arr_type = arr.get('type', 'unknown')
-                                arraytype = arr.get('arraytype', 'unknown')
-                                description = arr.get('description', 'unknown')
-                                unit = arr.get('unit', '')
-
-                                print(f"\n  Array [{i}]: {description} ({unit})")
-                                print(f"    type: {arr_type}")
-                                print(f"    arraytype: {arraytype}")
-
-                                # Show datavalues structure
-                                if 'datavalues' in arr and isinstance(arr['datavalues'], list):
-                                    datavals = arr['datavalues']
-                                    print(f"    datavalues: {len(datavals)} items")
-                                    if len(datavals) > 0:
-                                        print(f"      First 3 items: {datavals[:3]}")
-                                        print(f"      Type of first item: {type(datavals[0])}")
+    # Try to parse as JSON - might be multiple objects
+    print(f"Attempting to parse JSON...")
 
+    # Fast path: orjson, ignoring the trailing BOM PS Trace writes after the object
+    if orjson is not None:
+        try:
+            data = orjson.loads(content.rstrip('\ufeff'))
+            print("  ✓ Parsed with orjson")
             return data
+        except orjson.JSONDecodeError as e:
+            print(f"  orjson failed ({e}), retrying with json")
+
+    # Parse the first object and inspect what follows it, rather than relying
+    # on json.loads failing with an "Extra data" message
+    import json
+    start = json.decoder.WHITESPACE.match(content, 0).end()
+    data, idx = _json_decoder().raw_decode(content, start)
+    if content[idx:].strip():
+        print(f"  Found extra data at position {idx}")
+        print(f"  ✓ Successfully parsed first JSON object (ends at position {idx})")
+        print(f"  Content after JSON object ({len(content) - idx} chars):")
+        print(_safe_snippet(content, idx, 200))
+
+    return data
+
+def normalized_path(filepath):
+    """Path of the UTF-8 copy written by --normalize"""
+    return filepath + NORMALIZED_SUFFIX
+
+def write_normalized_copy(filepath, encoding):
+    """Transcode the file to UTF-8 without BOMs, chunk by chunk, next to the original"""
+    target = normalized_path(filepath)
+    with open(filepath, 'rb') as src:
+        reader = _Utf8Reader(src, encoding)
+        with open(target, 'wb') as dst:
+            while True:
+                chunk = reader.read(1 << 20)
+                if not chunk:
+                    break
+                dst.write(chunk)
+    print(f"✓ Wrote normalized UTF-8 copy: {target}")
+
+def analyze_pssession(filepath, use_cache=True, normalize=False):
+    """Analyze .pssession file structure
+
+    The report is collected in memory and written to stdout in one call.
+    Reports are cached per file modification time and size; on a cache hit
+    the file is not read at all.
+
+    With normalize=True a UTF-8 copy of the file is written next to it (see
+    normalized_path); whenever that copy is newer than the original it is
+    read instead, skipping the slower UTF-16 decode.
+
+    Returns a small summary dict (see summarize_structure) rather than the
+    document itself, or None if the file could not be parsed.
+    """
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf):
+            return _analyze_pssession(filepath, use_cache, normalize)
+    finally:
+        sys.stdout.write(buf.getvalue())
+
+def _analyze_pssession(filepath, use_cache, normalize):
+    print(f"Analyzing: {filepath}\n")
+
+    stat = os.stat(filepath)
+    key = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    source = normalized_path(filepath)
+    have_copy = os.path.exists(source) and os.stat(source).st_mtime_ns >= stat.st_mtime_ns
+
+    cached = load_cached_report(filepath, key) if use_cache else None
+    if cached is not None:
+        encoding, report, summary = cached
+        print(f"File size: {stat.st_size} bytes")
+        print(f"Using cached analysis (encoding: {encoding})\n")
+        print(report, end='')
+        # A cached report still honours --normalize; the encoding is known
+        if normalize and not have_copy:
+            write_normalized_copy(filepath, encoding)
+        return summary
+
+    # Prefer an up-to-date UTF-8 copy from an earlier --normalize run
+    if have_copy:
+        print(f"Reading normalized copy: {source}\n")
+    else:
+        source = filepath
+
+    summary = _load_and_report(source, filepath, key)
+    if normalize and summary is not None and not have_copy:
+        write_normalized_copy(filepath, summary['encoding'])
+    return summary
+
+def _load_and_report(source, filepath, key):
+    """Load `source`, print the report and cache it under `filepath`"""
+    # Only the header is needed up front; decoding below maps the file itself
+    print(f"File size: {os.path.getsize(source)} bytes")
+    with open(source, 'rb') as f:
+        head = f.read(20)
+
+    print(f"First 20 bytes: {head.hex()}")
+    print(f"First 20 bytes (repr): {repr(head)}")
+    print()
+
+    # Happy path: decode once with the encoding given by the BOM
+    encoding, bom_len = sniff_encoding(head[:4])
+    print(f"Detected encoding: {encoding}")
+    try:
+        if ijson is not None:
+            # Stream the structure without loading the whole document
+            data = sketch_pssession(source, encoding)
+        else:
+            data = parse_json_content(decode_mapped(source, encoding, bom_len))
+            print(f"✓ Successfully loaded with encoding: {encoding}\n")
+        return _report(data, filepath, key, encoding)
+    except PARSE_ERRORS as e:
+        print(f"✗ Failed with detected encoding {encoding}: {e}\n")
+
+    import json
+
+    # Try reading with different encodings
+    encodings = ['utf-16-le', 'utf-16', 'utf-8', 'utf-8-sig']
+
+    tried = codecs.lookup(encoding).name
+    for encoding in encodings:
+        if codecs.lookup(encoding).name == tried:
+            continue  # Already failed above
+        try:
+            print(f"Trying encoding: {encoding}")
+            content = decode_mapped(source, encoding)
+
+            data = parse_json_content(content)
+            del content
+
+            print(f"✓ Successfully loaded with encoding: {encoding}\n")
+            return _report(data, filepath, key, encoding)
 
         except json.JSONDecodeError as e:
             print(f"✗ JSON decode error with {encoding}: {e}\n")
@@ -212,9 +696,15 @@ def analyze_pssession(filepath):
     return None
 
 if __name__ == "__main__":
-    filepath = "PBS 1x DUT 1_2.pssession"
-
-    if len(sys.argv) > 1:
-        filepath = sys.argv[1]
-
-    analyze_pssession(filepath)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Analyze PS Trace .pssession file structure')
+    parser.add_argument('filepath', nargs='?', default="PBS 1x DUT 1_2.pssession",
+                        help='.pssession file to analyze')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore the cached report and re-read the file')
+    parser.add_argument('--normalize', action='store_true',
+                        help=f'Write a UTF-8 copy ({NORMALIZED_SUFFIX}) that later runs read instead')
+    args = parser.parse_args()
+
+    analyze_pssession(args.filepath, use_cache=not args.no_cache, normalize=args.normalize)
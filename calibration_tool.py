@@ -7,12 +7,14 @@ Communicates directly with STM32 via UART (bypasses ESP32).
 
 import serial
 import serial.tools.list_ports
+import argparse
 import struct
 import csv
-import sys
 import os
 import time
+import warnings
 import numpy as np
+from collections import deque
 from datetime import datetime
 
 # UART Constants
@@ -23,24 +25,48 @@ CMD_START_BYTE = 0xAA
 CMD_END_BYTE = 0x55
 CMD_START_MEASUREMENT = 0x03
 
-# Data packet types (from STM32)
-PACKET_DUT_START = 0x10
-PACKET_FREQUENCY = 0x11
-PACKET_DUT_END = 0x12
+# Precompiled command layout
+START_PACKET = struct.Struct('<BB I I I B')  # [START][CMD][data1:4][data2:4][data3:4][END]
+
+# Sweeps are stored as parallel arrays (one per field) rather than a dict per point
+SWEEP_DTYPES = {
+    'freq': np.int64,
+    'v_mag': np.float64,
+    'i_mag': np.float64,
+    'phase': np.float64,
+    'pga_gain': np.int64,
+    'tia_gain': np.int64,
+    'valid': np.bool_,
+}
+
+
+def wrap180(phase):
+    """Wrap a phase (scalar or array, degrees) into [-180, 180)"""
+    return (phase + 180.0) % 360.0 - 180.0
+
+
+def empty_sweep():
+    """Sweep with no frequency points"""
+    return {name: np.empty(0, dtype=dtype) for name, dtype in SWEEP_DTYPES.items()}
 
 
 class STM32Communication:
     """Handles UART communication with STM32"""
 
-    def __init__(self, port, baud=UART_BAUD_RATE):
+    def __init__(self, port, baud=UART_BAUD_RATE, verbose=False):
         self.port = port
         self.baud = baud
         self.ser = None
+        self._rx_buf = bytearray()  # Received bytes; lines before _rx_pos are consumed
+        self._rx_pos = 0
+        self.verbose = verbose  # Echo every received line as it arrives
+        self.rx_log = deque(maxlen=200)  # Recent received lines, dumped on timeout
 
     def connect(self):
         """Open serial connection to STM32"""
         try:
             self.ser = serial.Serial(self.port, self.baud, timeout=10)
+            self._enable_low_latency()
             time.sleep(2)  # Wait for connection to stabilize
             self.ser.reset_input_buffer()
             self.ser.reset_output_buffer()
@@ -50,6 +76,16 @@ class STM32Communication:
             print(f"✗ Failed to connect: {e}")
             return False
 
+    def _enable_low_latency(self):
+        """Ask the USB-serial driver for ~1 ms instead of ~16 ms RX latency (Linux only)"""
+        set_low_latency = getattr(self.ser, 'set_low_latency_mode', None)
+        if set_low_latency is None:
+            return
+        try:
+            set_low_latency(True)
+        except (ValueError, OSError):
+            pass  # Driver doesn't support ASYNC_LOW_LATENCY
+
     def disconnect(self):
         """Close serial connection"""
         if self.ser and self.ser.is_open:
@@ -60,15 +96,16 @@ class STM32Communication:
         """Send START command to STM32"""
         # Clear buffer
         self.ser.reset_input_buffer()
+        self._rx_buf.clear()
+        self._rx_pos = 0
 
         # Pack command: [START][CMD][data1:4][data2:4][data3:4][END]
-        packet = struct.pack('<BB I I I B',
-                            CMD_START_BYTE,
-                            CMD_START_MEASUREMENT,
-                            num_duts,  # data1 = number of DUTs
-                            0,         # data2 = unused
-                            0,         # data3 = unused
-                            CMD_END_BYTE)
+        packet = START_PACKET.pack(CMD_START_BYTE,
+                                   CMD_START_MEASUREMENT,
+                                   num_duts,  # data1 = number of DUTs
+                                   0,         # data2 = unused
+                                   0,         # data3 = unused
+                                   CMD_END_BYTE)
 
         self.ser.write(packet)
         time.sleep(0.1)
@@ -79,208 +116,148 @@ class STM32Communication:
         """Receive sweep data from STM32 via text CSV format"""
         print("\n=== Receiving Sweep Data ===")
 
-        # Wait for DUT_1_VOLTAGE marker
-        print("Waiting for DUT_1_VOLTAGE marker...")
-        voltage_header = self._read_until_marker("DUT_1_VOLTAGE")
-        if not voltage_header:
-            print("✗ Timeout waiting for voltage data")
-            return []
-
-        # Parse voltage header to get frequency count
-        parts = voltage_header.split(',')
-        num_freqs = int(parts[1]) if len(parts) > 1 else 0
-        print(f"← DUT 1 VOLTAGE ({num_freqs} frequencies)")
+        voltage_data = self._read_section("DUT_1_VOLTAGE", "voltage")
+        if voltage_data is None:
+            return empty_sweep()
+
+        current_data = self._read_section("DUT_1_CURRENT", "current")
+        if current_data is None:
+            return empty_sweep()
+
+        # Combine voltage and current data, keeping points whose frequencies line up
+        n = min(len(voltage_data['freq']), len(current_data['freq']))
+        match = voltage_data['freq'][:n] == current_data['freq'][:n]
+        v = {name: col[:n][match] for name, col in voltage_data.items()}
+        i = {name: col[:n][match] for name, col in current_data.items()}
+
+        # Calculate phase difference (V - I), normalized to -180 to 180
+        phase_diff = wrap180(v['phase'] - i['phase'])
+
+        combined_data = {
+            'freq': v['freq'],
+            'v_mag': v['mag'],
+            'i_mag': i['mag'],
+            'phase': phase_diff,
+            'pga_gain': v['pga_gain'],
+            'tia_gain': v['tia_gain'],
+            'valid': v['valid'] & i['valid']
+        }
+
+        points = zip(v['freq'].tolist(), v['mag'].tolist(), i['mag'].tolist(), phase_diff.tolist(),
+                     v['pga_gain'].tolist(), v['tia_gain'].tolist())
+        report = [f"  {freq} Hz: V={v_mag:.3f}, I={i_mag:.3f}, φ={phase:.2f}°, PGA={pga_gain}, TIA={tia_gain}"
+                  for freq, v_mag, i_mag, phase, pga_gain, tia_gain in points]
+        if report:
+            print('\n'.join(report))
+
+        print(f"✓ Received {len(phase_diff)} frequency points\n")
+        return combined_data
 
-        # Read voltage data lines
-        voltage_data = []
-        for _ in range(num_freqs):
-            line = self._read_line()
-            if line:
-                parts = line.split(',')
-                if len(parts) >= 6:
-                    freq_hz = int(parts[0])
-                    magnitude = float(parts[1]) / 1000.0  # Convert from magnitude*1000
-                    phase_deg = float(parts[2]) / 100.0   # Convert from phase*100
-                    pga_gain = int(parts[3])
-                    tia_gain = int(parts[4])
-                    valid = bool(int(parts[5]))
-                    voltage_data.append({
-                        'freq': freq_hz,
-                        'v_mag': magnitude,
-                        'v_phase': phase_deg,
-                        'pga_gain': pga_gain,
-                        'tia_gain': tia_gain,
-                        'valid': valid
-                    })
-
-        # Wait for DUT_1_CURRENT marker
-        print("Waiting for DUT_1_CURRENT marker...")
-        current_header = self._read_until_marker("DUT_1_CURRENT")
-        if not current_header:
-            print("✗ Timeout waiting for current data")
-            return []
-
-        parts = current_header.split(',')
-        num_freqs = int(parts[1]) if len(parts) > 1 else 0
-        print(f"← DUT 1 CURRENT ({num_freqs} frequencies)")
-
-        # Read current data lines
-        current_data = []
+    def _read_section(self, marker, name):
+        """Wait for a section marker and parse its rows straight into arrays; None on timeout
+
+        Rows are freq, magnitude*1000, phase*100, pga_gain, tia_gain, valid.
+        """
+        print(f"Waiting for {marker} marker...")
+        header = self._read_until_marker(marker)
+        if not header:
+            print(f"✗ Timeout waiting for {name} data")
+            self.dump_rx_log()
+            return None
+
+        # Header gives the frequency count, so the columns are filled in place
+        parts = header.split(',')
+        num_freqs = max(int(parts[1]), 0) if len(parts) > 1 else 0
+        print(f"← DUT 1 {name.upper()} ({num_freqs} frequencies)")
+
+        freq = np.empty(num_freqs, dtype=np.int64)
+        mag = np.empty(num_freqs, dtype=np.float64)
+        phase = np.empty(num_freqs, dtype=np.float64)
+        pga_gain = np.empty(num_freqs, dtype=np.int64)
+        tia_gain = np.empty(num_freqs, dtype=np.int64)
+        valid = np.empty(num_freqs, dtype=np.bool_)
+
+        n = 0
         for _ in range(num_freqs):
             line = self._read_line()
-            if line:
-                parts = line.split(',')
-                if len(parts) >= 6:
-                    freq_hz = int(parts[0])
-                    magnitude = float(parts[1]) / 1000.0  # Convert from magnitude*1000
-                    phase_deg = float(parts[2]) / 100.0   # Convert from phase*100
-                    pga_gain = int(parts[3])
-                    tia_gain = int(parts[4])
-                    valid = bool(int(parts[5]))
-                    current_data.append({
-                        'freq': freq_hz,
-                        'i_mag': magnitude,
-                        'i_phase': phase_deg,
-                        'pga_gain': pga_gain,
-                        'tia_gain': tia_gain,
-                        'valid': valid
-                    })
-
-        # Combine voltage and current data
-        combined_data = []
-        for v_point, i_point in zip(voltage_data, current_data):
-            if v_point['freq'] == i_point['freq']:
-                # Calculate phase difference (V - I)
-                phase_diff = v_point['v_phase'] - i_point['i_phase']
-
-                # Normalize phase to -180 to 180
-                while phase_diff > 180:
-                    phase_diff -= 360
-                while phase_diff < -180:
-                    phase_diff += 360
-
-                combined_data.append({
-                    'freq': v_point['freq'],
-                    'v_mag': v_point['v_mag'],
-                    'i_mag': i_point['i_mag'],
-                    'phase': phase_diff,
-                    'pga_gain': v_point['pga_gain'],
-                    'tia_gain': v_point['tia_gain'],
-                    'valid': v_point['valid'] and i_point['valid']
-                })
-
-                print(f"  {v_point['freq']} Hz: V={v_point['v_mag']:.3f}, I={i_point['i_mag']:.3f}, φ={phase_diff:.2f}°, PGA={v_point['pga_gain']}, TIA={v_point['tia_gain']}")
-
-        print(f"✓ Received {len(combined_data)} frequency points\n")
-        return combined_data
+            if not line:
+                continue
+            parts = line.split(',')
+            if len(parts) < 6:
+                continue
+            freq[n] = int(parts[0])
+            mag[n] = float(parts[1]) / 1000.0    # Convert from magnitude*1000
+            phase[n] = float(parts[2]) / 100.0   # Convert from phase*100
+            pga_gain[n] = int(parts[3])
+            tia_gain[n] = int(parts[4])
+            valid[n] = bool(int(parts[5]))
+            n += 1
+
+        return {
+            'freq': freq[:n],
+            'mag': mag[:n],
+            'phase': phase[:n],
+            'pga_gain': pga_gain[:n],
+            'tia_gain': tia_gain[:n],
+            'valid': valid[:n]
+        }
+
+    def _log_rx(self, line):
+        """Record a received line, echoing it only in verbose mode"""
+        self.rx_log.append(line)
+        if self.verbose:
+            print(f"  RX: {line}")
+
+    def dump_rx_log(self):
+        """Print the most recently received lines"""
+        for line in self.rx_log:
+            print(f"  RX: {line}")
+        self.rx_log.clear()
+
+    def _fill(self):
+        """Drain everything the driver has buffered in one read (blocks for at least one byte)"""
+        # Compact consumed lines away before appending, so the buffer only moves once per read
+        if self._rx_pos:
+            del self._rx_buf[:self._rx_pos]
+            self._rx_pos = 0
+        self._rx_buf += self.ser.read(max(1, self.ser.in_waiting))
+
+    def _next_line(self, deadline):
+        """Decode the next whole line from the RX buffer, reading more as needed; None at the deadline"""
+        while True:
+            end = self._rx_buf.find(b'\n', self._rx_pos)
+            if end >= 0:
+                line = self._rx_buf[self._rx_pos:end].decode('utf-8', errors='ignore').strip()
+                self._rx_pos = end + 1
+                return line
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            # Block for no longer than what is left of the caller's timeout
+            self.ser.timeout = remaining
+            self._fill()
 
     def _read_until_marker(self, marker, timeout=120.0):
         """Read lines until marker is found"""
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            if self.ser.in_waiting:
-                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                print(f"  RX: {line}")  # ECHO EVERYTHING
-                if marker in line:
-                    return line
-        return None
+        deadline = time.time() + timeout
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                return None
+            self._log_rx(line)
+            if marker in line:
+                return line
 
     def _read_line(self, timeout=5.0):
         """Read a single line"""
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            if self.ser.in_waiting:
-                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    print(f"  RX: {line}")  # ECHO EVERYTHING
-                    return line
-        return None
-
-
-    def _old_receive_sweep_data(self):
-        """OLD: Receive sweep data from STM32 via binary packets"""
-        print("\n=== Receiving Sweep Data ===")
-
-        data = []
-        timeout_count = 0
-        max_timeouts = 500  # 50 seconds total
-
-        while timeout_count < max_timeouts:
-            if self.ser.in_waiting > 0:
-                # Read one byte and look for start marker
-                byte = self.ser.read(1)
-                if len(byte) == 0:
-                    continue
-
-                if byte[0] == CMD_START_BYTE:
-                    # Read packet type
-                    packet_type_byte = self.ser.read(1)
-                    if len(packet_type_byte) == 0:
-                        continue
-
-                    packet_type = packet_type_byte[0]
-
-                    if packet_type == PACKET_DUT_START:
-                        # DUT START: [0xAA][0x10][dut][freq_count][res][res][0x55]
-                        payload = self.ser.read(5)  # dut, freq_count, res, res, end
-                        if len(payload) == 5:
-                            dut, freq_count = payload[0], payload[1]
-                            print(f"← DUT {dut} START ({freq_count} frequencies)")
-
-                    elif packet_type == PACKET_FREQUENCY:
-                        # FREQUENCY: [0xAA][0x11][freq:4][V_mag:4][V_phase:4][I_mag:4][I_phase:4][pga:1][tia:1][valid:1][0x55]
-                        payload = self.ser.read(24)  # 23 data bytes + 1 end byte
-                        if len(payload) == 24:
-                            # Unpack frequency data
-                            freq, v_mag, v_phase, i_mag, i_phase, pga_gain, tia_gain, valid = struct.unpack(
-                                '<I I i I i BBB', payload[:23])
-
-                            # Convert scaled values
-                            v_mag_float = v_mag / 1000.0
-                            i_mag_float = i_mag / 1000.0
-                            v_phase_float = v_phase / 100.0
-                            i_phase_float = i_phase / 100.0
-
-                            # Phase difference (V - I)
-                            phase_diff = v_phase_float - i_phase_float
-
-                            # Normalize phase to -180 to 180
-                            while phase_diff > 180:
-                                phase_diff -= 360
-                            while phase_diff < -180:
-                                phase_diff += 360
-
-                            point = {
-                                'freq': freq,
-                                'v_mag': v_mag_float,
-                                'i_mag': i_mag_float,
-                                'phase': phase_diff,
-                                'pga_gain': pga_gain,
-                                'tia_gain': tia_gain,
-                                'valid': bool(valid)
-                            }
-
-                            data.append(point)
-                            print(f"  {freq} Hz: V={v_mag_float:.3f}, I={i_mag_float:.3f}, φ={phase_diff:.2f}°, PGA={pga_gain}, TIA={tia_gain}")
-
-                    elif packet_type == PACKET_DUT_END:
-                        # DUT END: [0xAA][0x12][dut][0x55]
-                        payload = self.ser.read(2)
-                        if len(payload) == 2:
-                            dut = payload[0]
-                            print(f"← DUT {dut} END")
-                            break  # Done receiving
-
-                timeout_count = 0  # Reset timeout on successful read
-            else:
-                time.sleep(0.1)
-                timeout_count += 1
-
-        if timeout_count >= max_timeouts:
-            print("✗ Timeout waiting for data")
-
-        print(f"✓ Received {len(data)} frequency points\n")
-        return data
+        deadline = time.time() + timeout
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                return None
+            if line:
+                self._log_rx(line)
+                return line
 
 
 class PalmSensParser:
@@ -312,49 +289,52 @@ class PalmSensParser:
         if data_start == 0:
             raise ValueError("Could not find data header in PalmSens CSV")
 
-        # Parse data rows
-        data = []
-        for line in lines[data_start:]:
-            line = line.strip()
-            if not line or line.startswith('�'):
-                continue
-
-            parts = [p.strip() for p in line.split(',')]
-            if len(parts) < 4:
-                continue
-
-            try:
-                # Columns: freq, neg_phase, Idc, Z_magnitude, ...
-                freq = float(parts[0])
-                neg_phase = float(parts[1])
-                z_mag = float(parts[3])
-
-                # Negate the phase (column is "neg. Phase")
-                phase = -neg_phase
-
-                # Normalize phase
-                while phase > 180:
-                    phase -= 360
-                while phase < -180:
-                    phase += 360
-
-                data.append({
-                    'freq': freq,
-                    'z_mag': z_mag,
-                    'phase': phase
-                })
-            except (ValueError, IndexError):
-                continue
-
-        if len(data) == 0:
+        # Columns are freq, neg_phase, Idc, Z_magnitude, ...
+        data_lines = lines[data_start:]
+        try:
+            # PS Trace ends the file with a stray BOM, so it is used as the
+            # comment marker to skip that line
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')  # Empty data warning
+                rows = np.loadtxt(data_lines, delimiter=',', usecols=(0, 1, 3), comments='\ufeff',
+                                  dtype=np.float64, ndmin=2)
+        except ValueError:
+            rows = PalmSensParser._parse_rows(data_lines)
+
+        # Negate the phase (column is "neg. Phase") and normalize it
+        phase = wrap180(-rows[:, 1])
+
+        data = {
+            'freq': rows[:, 0],
+            'z_mag': rows[:, 2],
+            'phase': phase
+        }
+
+        if len(data['freq']) == 0:
             raise ValueError("No valid data in PalmSens CSV")
 
-        print(f"✓ Loaded {len(data)} reference points")
-        print(f"  Freq range: {data[0]['freq']:.1f} - {data[-1]['freq']:.1f} Hz")
-        print(f"  Z range: {min(d['z_mag'] for d in data):.1f} - {max(d['z_mag'] for d in data):.1f} Ω\n")
+        print(f"✓ Loaded {len(data['freq'])} reference points")
+        print(f"  Freq range: {data['freq'][0]:.1f} - {data['freq'][-1]:.1f} Hz")
+        print(f"  Z range: {data['z_mag'].min():.1f} - {data['z_mag'].max():.1f} Ω\n")
 
         return data
 
+    @staticmethod
+    def _parse_rows(data_lines):
+        """Tolerant row parser: (freq, neg_phase, Z) per row, skipping short or non-numeric rows"""
+        # Preallocate for every line and trim to the rows that parsed
+        rows = np.empty((len(data_lines), 3), dtype=np.float64)
+        n_valid = 0
+        for row in csv.reader(data_lines):
+            if len(row) < 4:
+                continue
+            try:
+                rows[n_valid] = (float(row[0]), float(row[1]), float(row[3]))
+            except ValueError:
+                continue
+            n_valid += 1
+        return rows[:n_valid]
+
 
 class CalibrationCalculator:
     """Calculate calibration factors"""
@@ -362,112 +342,157 @@ class CalibrationCalculator:
     @staticmethod
     def average_sweeps(sweep1, sweep2):
         """Average two sweeps"""
-        if len(sweep1) != len(sweep2):
-            print(f"WARNING: Sweep lengths differ ({len(sweep1)} vs {len(sweep2)})")
-
-        averaged = []
-
-        for p1, p2 in zip(sweep1, sweep2):
-            if p1['freq'] != p2['freq']:
-                print(f"WARNING: Frequency mismatch ({p1['freq']} vs {p2['freq']})")
-                continue
-
-            # Average magnitudes
-            v_mag_avg = (p1['v_mag'] + p2['v_mag']) / 2.0
-            i_mag_avg = (p1['i_mag'] + p2['i_mag']) / 2.0
-
-            # Circular mean for phase
-            phase1_rad = np.radians(p1['phase'])
-            phase2_rad = np.radians(p2['phase'])
-            phase_avg_rad = np.arctan2(
-                (np.sin(phase1_rad) + np.sin(phase2_rad)) / 2.0,
-                (np.cos(phase1_rad) + np.cos(phase2_rad)) / 2.0
-            )
-            phase_avg = np.degrees(phase_avg_rad)
-
-            averaged.append({
-                'freq': p1['freq'],
-                'v_mag': v_mag_avg,
-                'i_mag': i_mag_avg,
-                'phase': phase_avg,
-                'pga_gain': p1['pga_gain'],
-                'tia_gain': p1['tia_gain'],
-                'valid': p1['valid'] and p2['valid']
-            })
-
-        return averaged
+        n1, n2 = len(sweep1['freq']), len(sweep2['freq'])
+        if n1 != n2:
+            print(f"WARNING: Sweep lengths differ ({n1} vs {n2})")
+
+        n = min(n1, n2)
+        s1 = {name: col[:n] for name, col in sweep1.items()}
+        s2 = {name: col[:n] for name, col in sweep2.items()}
+
+        match = s1['freq'] == s2['freq']
+        for f1, f2 in zip(s1['freq'][~match], s2['freq'][~match]):
+            print(f"WARNING: Frequency mismatch ({f1} vs {f2})")
+        s1 = {name: col[match] for name, col in s1.items()}
+        s2 = {name: col[match] for name, col in s2.items()}
+
+        # Circular mean for phase: angle of the sum of the two unit phasors
+        phase_avg = np.degrees(np.angle(np.exp(1j * np.radians(s1['phase']))
+                                        + np.exp(1j * np.radians(s2['phase']))))
+
+        return {
+            'freq': s1['freq'],
+            'v_mag': (s1['v_mag'] + s2['v_mag']) / 2.0,
+            'i_mag': (s1['i_mag'] + s2['i_mag']) / 2.0,
+            'phase': phase_avg,
+            'pga_gain': s1['pga_gain'],
+            'tia_gain': s1['tia_gain'],
+            'valid': s1['valid'] & s2['valid']
+        }
 
     @staticmethod
     def calculate_calibration(ps_data, stm_data):
         """Calculate calibration factors"""
         print("\n=== Calculating Calibration ===")
 
-        # Create lookup dict for PalmSens data
-        ps_lookup = {int(p['freq']): p for p in ps_data}
-
-        cal_data = []
-
-        for stm_point in stm_data:
-            freq = int(stm_point['freq'])
+        # Align STM32 frequencies with the (integer) PalmSens frequencies by binary search;
+        # side='right' picks the last PalmSens row when a frequency repeats
+        ps_freq = ps_data['freq'].astype(np.int64)
+        order = np.argsort(ps_freq, kind='stable')
+        ps_freq = ps_freq[order]
+
+        freq = stm_data['freq']
+        pos = np.searchsorted(ps_freq, freq, side='right') - 1
+        has_ref = pos >= 0
+        has_ref[has_ref] = ps_freq[pos[has_ref]] == freq[has_ref]
+        has_current = stm_data['i_mag'] > 0
+        keep = has_ref & has_current
+
+        # Get PalmSens reference for the kept points
+        ps_rows = order[pos[keep]]
+        z_ps = ps_data['z_mag'][ps_rows]
+        phase_ps = ps_data['phase'][ps_rows]
+
+        # Calculate STM32 impedance
+        z_stm = stm_data['v_mag'][keep] / stm_data['i_mag'][keep]
+        phase_stm = stm_data['phase'][keep]
+
+        # Calculate calibration factors
+        z_mag_gain = z_ps / z_stm
+        phase_offset = wrap180(phase_ps - phase_stm)
+
+        cal_data = {
+            'freq': freq[keep],
+            'tia_mode': (stm_data['tia_gain'][keep] != 0).astype(np.int64),  # 0=low TIA (tia_gain=False), 1=high TIA (tia_gain=True)
+            'pga_gain': stm_data['pga_gain'][keep],
+            'z_mag_gain': z_mag_gain,
+            'phase_offset': phase_offset,
+            'z_stm': z_stm,
+            'z_ps': z_ps,
+            'error_pct': ((z_stm - z_ps) / z_ps) * 100
+        }
+
+        # Report every point in sweep order in one write, formatting from plain
+        # Python values rather than indexing a NumPy scalar per field
+        kept = zip(z_stm.tolist(), z_ps.tolist(), z_mag_gain.tolist(), phase_offset.tolist())
+        report = []
+        for f, ref, current in zip(freq.tolist(), has_ref.tolist(), has_current.tolist()):
+            if not ref:
+                report.append(f"WARNING: No PalmSens reference for {f} Hz - skipping")
+            elif not current:
+                report.append(f"WARNING: Invalid current at {f} Hz - skipping")
+            else:
+                zs, zp, gain, offset = next(kept)
+                report.append(f"{f:6d} Hz: Z_STM={zs:8.1f} Ω, Z_PS={zp:8.1f} Ω, gain={gain:.6f}, Δφ={offset:6.2f}°")
+        if report:
+            print('\n'.join(report))
 
-            if freq not in ps_lookup:
-                print(f"WARNING: No PalmSens reference for {freq} Hz - skipping")
-                continue
+        print(f"\n✓ Calculated calibration for {len(cal_data['freq'])} points\n")
+        return cal_data
 
-            ps_point = ps_lookup[freq]
 
-            # Calculate STM32 impedance
-            if stm_point['i_mag'] <= 0:
-                print(f"WARNING: Invalid current at {freq} Hz - skipping")
-                continue
+# Calibration table rows, keyed by (freq, tia_mode, pga_gain)
+CAL_DTYPE = np.dtype([
+    ('freq', np.int64),
+    ('tia_mode', np.int64),
+    ('pga_gain', np.int64),
+    ('z_mag_gain', np.float64),
+    ('unused', np.float64),
+    ('phase_offset', np.float64),
+])
+CAL_KEY = ['freq', 'tia_mode', 'pga_gain']
+CAL_ROW_FORMAT = ['%d', '%d', '%d', '%.6f', '%.6f', '%.2f']
 
-            z_stm = stm_point['v_mag'] / stm_point['i_mag']
-            phase_stm = stm_point['phase']
 
-            # Get PalmSens reference
-            z_ps = ps_point['z_mag']
-            phase_ps = ps_point['phase']
+class CalibrationFileManager:
+    """Manage calibration CSV file"""
 
-            # Calculate calibration factors
-            z_mag_gain = z_ps / z_stm
-            phase_offset = phase_ps - phase_stm
+    @staticmethod
+    def load_existing(filepath):
+        """Load existing calibration data as a CAL_DTYPE array sorted by key"""
+        if not os.path.exists(filepath):
+            return np.empty(0, dtype=CAL_DTYPE)
 
-            # Normalize phase offset
-            while phase_offset > 180:
-                phase_offset -= 360
-            while phase_offset < -180:
-                phase_offset += 360
+        rows = CalibrationFileManager._load_rows(filepath)
 
-            cal_point = {
-                'freq': freq,
-                'tia_mode': 1 if stm_point['tia_gain'] else 0,  # 0=low TIA (tia_gain=False), 1=high TIA (tia_gain=True)
-                'pga_gain': stm_point['pga_gain'],
-                'z_mag_gain': z_mag_gain,
-                'phase_offset': phase_offset,
-                'z_stm': z_stm,
-                'z_ps': z_ps,
-                'error_pct': ((z_stm - z_ps) / z_ps) * 100
-            }
+        cal = np.empty(len(rows), dtype=CAL_DTYPE)
+        for col, name in enumerate(CAL_DTYPE.names):
+            cal[name] = rows[:, col]
 
-            cal_data.append(cal_point)
+        return CalibrationFileManager._merge(cal)
 
-            print(f"{freq:6d} Hz: Z_STM={z_stm:8.1f} Ω, Z_PS={z_ps:8.1f} Ω, gain={z_mag_gain:.6f}, Δφ={phase_offset:6.2f}°")
+    @staticmethod
+    def _merge(cal):
+        """Sort rows by key, keeping only the last row for each repeated key"""
+        # np.unique sorts the keys and returns each key's first index, so run it
+        # over the reversed rows to let later rows win
+        cal = cal[::-1]
+        _, first = np.unique(cal[CAL_KEY], return_index=True)
+        return cal[first]
 
-        print(f"\n✓ Calculated calibration for {len(cal_data)} points\n")
-        return cal_data
+    @staticmethod
+    def _load_rows(filepath):
+        """Read calibration rows as an (N, 6) float array, skipping comments and malformed lines"""
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # Empty file warning
+            try:
+                rows = np.loadtxt(filepath, delimiter=',', comments='#', dtype=np.float64, ndmin=2)
+            except ValueError:
+                rows = None
 
+        # Keys must be whole numbers, as casting to CAL_DTYPE would truncate them
+        if rows is not None and rows.shape[1] == 6:
+            keys = rows[:, :3]
+            if (np.isfinite(keys) & (keys == np.trunc(keys))).all():
+                return rows
 
-class CalibrationFileManager:
-    """Manage calibration CSV file"""
+        # Hand-edited file with a malformed line
+        return CalibrationFileManager._parse_lines(filepath)
 
     @staticmethod
-    def load_existing(filepath):
-        """Load existing calibration data"""
-        if not os.path.exists(filepath):
-            return {}
-
-        cal_dict = {}
-
+    def _parse_lines(filepath):
+        """Parse calibration rows line by line, dropping any line that doesn't parse"""
+        rows = []
         with open(filepath, 'r') as f:
             for line in f:
                 line = line.strip()
@@ -479,23 +504,11 @@ class CalibrationFileManager:
                     continue
 
                 try:
-                    freq = int(parts[0])
-                    tia_mode = int(parts[1])
-                    pga_gain = int(parts[2])
-                    z_mag_gain = float(parts[3])
-                    unused = float(parts[4])
-                    phase_offset = float(parts[5])
-
-                    key = (freq, tia_mode, pga_gain)
-                    cal_dict[key] = {
-                        'z_mag_gain': z_mag_gain,
-                        'unused': unused,
-                        'phase_offset': phase_offset
-                    }
+                    rows.append([int(p) for p in parts[:3]] + [float(p) for p in parts[3:]])
                 except ValueError:
                     continue
 
-        return cal_dict
+        return np.array(rows, dtype=np.float64).reshape(-1, 6)
 
     @staticmethod
     def save(filepath, cal_data, existing_data=None):
@@ -504,16 +517,16 @@ class CalibrationFileManager:
 
         # Merge with existing data
         if existing_data is None:
-            existing_data = {}
+            existing_data = np.empty(0, dtype=CAL_DTYPE)
 
-        # Update with new calibration points
-        for point in cal_data:
-            key = (point['freq'], point['tia_mode'], point['pga_gain'])
-            existing_data[key] = {
-                'z_mag_gain': point['z_mag_gain'],
-                'unused': 1.0,  # Not used (for backward compatibility)
-                'phase_offset': point['phase_offset']
-            }
+        # New calibration points replace existing rows with the same key
+        new_data = np.empty(len(cal_data['freq']), dtype=CAL_DTYPE)
+        for name in ('freq', 'tia_mode', 'pga_gain', 'z_mag_gain', 'phase_offset'):
+            new_data[name] = cal_data[name]
+        new_data['unused'] = 1.0  # Not used (for backward compatibility)
+
+        # Sorted by frequency, tia_mode, pga_gain
+        merged = CalibrationFileManager._merge(np.concatenate([existing_data, new_data]))
 
         # Write to file
         with open(filepath, 'w') as f:
@@ -524,15 +537,9 @@ class CalibrationFileManager:
             f.write("# z_mag_gain: Impedance magnitude calibration gain\n")
             f.write("# unused: Reserved (previously current_gain)\n\n")
 
-            # Sort by frequency, tia_mode, pga_gain
-            sorted_keys = sorted(existing_data.keys())
-
-            for key in sorted_keys:
-                freq, tia_mode, pga_gain = key
-                cal = existing_data[key]
-                f.write(f"{freq},{tia_mode},{pga_gain},{cal['z_mag_gain']:.6f},{cal['unused']:.6f},{cal['phase_offset']:.2f}\n")
+            np.savetxt(f, merged, fmt=CAL_ROW_FORMAT, delimiter=',')
 
-        print(f"✓ Saved {len(existing_data)} calibration points to {filepath}\n")
+        print(f"✓ Saved {len(merged)} calibration points to {filepath}\n")
 
 
 def main():
@@ -543,14 +550,23 @@ def main():
     print("="*60 + "\n")
 
     # Parse arguments
-    if len(sys.argv) != 3:
-        print("Usage: python calibration_tool.py <palmsens_csv> <output_cal_csv>")
-        print("\nExample:")
-        print("  python calibration_tool.py dut1_pbs.csv calibration.csv")
-        return
-
-    ps_csv_path = sys.argv[1]
-    output_csv_path = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        description='BioPal Calibration Tool',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Example:
+  python calibration_tool.py dut1_pbs.csv calibration.csv
+        '''
+    )
+    parser.add_argument('palmsens_csv', help='PalmSens reference CSV')
+    parser.add_argument('output_cal_csv', help='Calibration CSV to create or update')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Echo every line received from the STM32')
+
+    args = parser.parse_args()
+
+    ps_csv_path = args.palmsens_csv
+    output_csv_path = args.output_cal_csv
 
     # Check input file exists
     if not os.path.exists(ps_csv_path):
@@ -586,7 +602,7 @@ def main():
         return
 
     # Connect to STM32
-    stm = STM32Communication(stm_port)
+    stm = STM32Communication(stm_port, verbose=args.verbose)
     if not stm.connect():
         return
 
@@ -613,7 +629,7 @@ def main():
         # Average sweeps
         print("=== Averaging Sweeps ===")
         averaged_data = CalibrationCalculator.average_sweeps(sweep1, sweep2)
-        print(f"✓ Averaged {len(averaged_data)} points\n")
+        print(f"✓ Averaged {len(averaged_data['freq'])} points\n")
 
         # Calculate calibration
         cal_data = CalibrationCalculator.calculate_calibration(ps_data, averaged_data)
@@ -10,13 +10,194 @@ import serial.tools.list_ports
 import json
 import sys
 import os
+import re
 from datetime import datetime
-import math
+from functools import lru_cache
 import argparse
+import warnings
+import numpy as np
+
+# Optional: C JSON encoder, much faster than json.dumps for the datavalue arrays
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Lines the ESP32 prints around the CSV block
+CSV_START_MARKER = "========== IMPEDANCE DATA CSV =========="
+CSV_END_MARKER = "========================================"
+MARKER_LENGTH = min(len(CSV_START_MARKER), len(CSV_END_MARKER))
+
+# One serial line including its newline ('\r\n' endings keep the '\r')
+LINE_RE = re.compile(r'[^\n]*\n')
+
+# PS Trace dataset layout for one DUT; only the datavalues arrays vary
+DATASET_TEMPLATE = (
+    '{"type":"PalmSens.Data.DataSetEIS","values":['
+    # Array 0: Idc
+    '{"type":"PalmSens.Data.DataArrayCurrents","arraytype":2,"description":"Idc",'
+    '"unit":{"type":"PalmSens.Units.MicroAmpere","s":"A","q":"Current","a":"i"},'
+    '"datavalues":%(idc)s,"datavaluetype":"PalmSens.Data.DataValue.DataValueCurrentRange"},'
+    # Array 1: potential
+    '{"type":"PalmSens.Data.DataArrayPotentials","arraytype":1,"description":"potential",'
+    '"unit":{"type":"PalmSens.Units.Volt","s":"V","q":"Potential","a":"E"},'
+    '"datavalues":%(potential)s,"datavaluetype":"PalmSens.Data.DataValue.DataValueGainRange"},'
+    # Array 2: time
+    '{"type":"PalmSens.Data.DataArrayTime","arraytype":0,"description":"time",'
+    '"unit":{"type":"PalmSens.Units.Time","s":"s","q":"Time","a":"t"},'
+    '"datavalues":%(time)s,"datavaluetype":"PalmSens.Data.DataValue.DataValue"},'
+    # Array 3: Frequency
+    '{"type":"PalmSens.Data.DataArray","arraytype":5,"description":"Frequency",'
+    '"unit":{"type":"PalmSens.Units.Hertz","s":"Hz","q":"Frequency","a":"f"},'
+    '"datavalues":%(freq)s,"datavaluetype":"PalmSens.Data.DataValue.DataValue"},'
+    # Array 4: ZRe
+    '{"type":"PalmSens.Data.DataArray","arraytype":7,"description":"ZRe",'
+    '"unit":{"type":"PalmSens.Units.ZRe","s":"Ω","q":"Z\'","a":"Z"},'
+    '"datavalues":%(z_re)s,"datavaluetype":"PalmSens.Data.DataValue.DataValue"},'
+    # Array 5: ZIm
+    '{"type":"PalmSens.Data.DataArray","arraytype":8,"description":"ZIm",'
+    '"unit":{"type":"PalmSens.Units.ZIm","s":"Ω","q":"-Z\'\'","a":"Z"},'
+    '"datavalues":%(z_im)s,"datavaluetype":"PalmSens.Data.DataValue.DataValue"},'
+    # Array 6: Z (magnitude)
+    '{"type":"PalmSens.Data.DataArray","arraytype":10,"description":"Z",'
+    '"unit":{"type":"PalmSens.Units.Z","s":"Ω","q":"Z","a":"Z"},'
+    '"datavalues":%(z_mag)s,"datavaluetype":"PalmSens.Data.DataValue.DataValue"},'
+    # Array 7: Phase
+    '{"type":"PalmSens.Data.DataArray","arraytype":6,"description":"Phase",'
+    '"unit":{"type":"PalmSens.Units.Phase","s":"°","q":"-Phase","a":"Phase"},'
+    '"datavalues":%(z_phase)s,"datavaluetype":"PalmSens.Data.DataValue.DataValue"},'
+    # Array 8: Iac
+    '{"type":"PalmSens.Data.DataArrayCurrents","arraytype":9,"description":"Iac",'
+    '"unit":{"type":"PalmSens.Units.MicroAmpere","s":"A","q":"Current","a":"i"},'
+    '"datavalues":%(iac)s,"datavaluetype":"PalmSens.Data.DataValue.DataValueCurrentRange"}'
+    ']}'
+)
+
+MEASUREMENT_TEMPLATE = (
+    '{"title":"DUT %(dut)s","timestamp":%(timestamp)d,"utctimestamp":%(timestamp)d,'
+    '"deviceused":0,"deviceserial":"BioPal-ESP32","devicefw":"1.0","type":".",'
+    '"dataset":%(dataset)s,"method":%(method)s,"curves":[],"eisdatalist":[]}'
+)
+
+SESSION_HEAD_TEMPLATE = (
+    '{"type":"PalmSens.DataFiles.SessionFile","coreversion":"5.8.1704.29098",'
+    '"methodformeasurement":%(method)s,"measurements":['
+)
+
+
+# Mock current/potential/time points (required by PS Trace), pre-encoded
+IDC_POINT_JSON = '{"v":0.0,"c":3,"s":0}'
+POTENTIAL_POINT_JSON = '{"v":0.0,"s":0,"r":3}'
+TIME_POINT_JSON = '{"v":0.0001}'
+
+
+def dump_json(obj):
+    """Serialize obj to compact JSON text, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'))
+
+
+@lru_cache(maxsize=32)
+def repeat_point_json(point_json, n):
+    """JSON list of n copies of a pre-encoded constant point (cached per length)"""
+    return '[' + ','.join([point_json] * n) + ']'
+
+
+def dump_value_array(values, extra=''):
+    """Serialize a float array as a JSON list of {"v": x} objects without building dicts"""
+    if len(values) == 0:
+        return '[]'
+    # repr() is the shortest round-trip form; non-finite values go through
+    # json.dumps so they come out as NaN/Infinity like the json encoder writes
+    items = map(repr if np.isfinite(values).all() else json.dumps, values.tolist())
+    return '[{"v":' + (extra + '},{"v":').join(items) + extra + '}]'
+
+
+def build_dataset_json(freq, mag, phase_deg):
+    """Build the PS Trace dataset JSON for one DUT's frequency sweep"""
+    phase_rad = np.radians(phase_deg)
+
+    # Calculate ZRe and ZIm from magnitude and phase
+    # Z = |Z| * e^(j*phase)
+    # Re(Z) = |Z| * cos(phase)
+    # Im(Z) = |Z| * sin(phase) (note: positive for phase)
+    z_re = mag * np.cos(phase_rad)
+    z_im = mag * np.sin(phase_rad)
+
+    # Calculate Iac from Z magnitude (assuming 10mV AC amplitude)
+    amplitude_v = 0.01  # 10mV
+    i_ac = np.zeros_like(mag)
+    np.divide(amplitude_v, mag, out=i_ac, where=mag > 0)
+    i_ac *= 1e6  # Convert to µA
+
+    n = len(freq)
+    return DATASET_TEMPLATE % {
+        'idc': repeat_point_json(IDC_POINT_JSON, n),
+        'potential': repeat_point_json(POTENTIAL_POINT_JSON, n),
+        'time': repeat_point_json(TIME_POINT_JSON, n),
+        'freq': dump_value_array(freq),
+        'z_re': dump_value_array(z_re),
+        'z_im': dump_value_array(z_im),
+        'z_mag': dump_value_array(mag),
+        'z_phase': dump_value_array(phase_deg),
+        'iac': dump_value_array(i_ac, ',"c":3,"s":0')
+    }
+
+
+def parse_impedance_rows(lines, warn_invalid=False):
+    """Parse DUT,Frequency,Magnitude,Phase rows into parallel column arrays"""
+    # Fast path: well-formed rows are parsed in C in one call
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # Empty input warning
+            rows = np.loadtxt(lines, delimiter=',', usecols=(0, 1, 2, 3), comments=None,
+                              dtype=np.float64, ndmin=2)
+        dut = rows[:, 0].astype(np.int64)
+        if np.array_equal(dut, rows[:, 0]):
+            return {
+                'dut': dut,
+                'frequency': rows[:, 1],
+                'magnitude': rows[:, 2],
+                'phase': rows[:, 3]
+            }
+    except ValueError:
+        pass
+
+    # Malformed or non-integer DUT rows: parse line by line, skipping bad rows
+    dut = np.empty(len(lines), dtype=np.int64)
+    frequency = np.empty(len(lines), dtype=np.float64)
+    magnitude = np.empty(len(lines), dtype=np.float64)
+    phase = np.empty(len(lines), dtype=np.float64)
+
+    n = 0
+    for line in lines:
+        parts = line.split(',')
+        if len(parts) >= 4:
+            try:
+                dut[n] = int(parts[0])
+                frequency[n] = float(parts[1])
+                magnitude[n] = float(parts[2])
+                phase[n] = float(parts[3])
+            except ValueError:
+                if warn_invalid:
+                    print(f"WARNING: Skipping invalid line: {line.strip()}")
+                continue
+            n += 1
+
+    return {
+        'dut': dut[:n],
+        'frequency': frequency[:n],
+        'magnitude': magnitude[:n],
+        'phase': phase[:n]
+    }
+
 
 class ESP32DataCapture:
-    def __init__(self):
+    def __init__(self, indent=None):
         self.ser = None
+        self.indent = indent  # Pretty-print .pssession JSON (debugging only)
         self.capturing_csv = False
         self.csv_lines = []
 
@@ -52,50 +233,34 @@ class ESP32DataCapture:
 
     def process_line(self, line):
         """Process incoming line from ESP32"""
-        # Check for CSV data markers
-        if "========== IMPEDANCE DATA CSV ==========" in line:
+        # Check for CSV data markers; lines shorter than a marker (such as
+        # the CSV rows themselves) can't contain one
+        long_enough = len(line) >= MARKER_LENGTH
+        if long_enough and CSV_START_MARKER in line:
             self.capturing_csv = True
             self.csv_lines = []
             print(line)  # Mirror to console
             return
 
         if self.capturing_csv:
-            if "========================================" in line and len(self.csv_lines) > 0:
+            if long_enough and CSV_END_MARKER in line and self.csv_lines:
                 # End of CSV data
                 print(line)  # Mirror to console
                 self.capturing_csv = False
                 self.save_data()
                 return
-            elif line.strip() and not line.startswith("==="):
-                # CSV data line
-                self.csv_lines.append(line.strip())
+            else:
+                stripped = line.strip()
+                if stripped and not line.startswith("==="):
+                    # CSV data line
+                    self.csv_lines.append(stripped)
 
         # Mirror all output to console
         print(line, end='')
 
     def parse_csv_data(self):
-        """Parse CSV lines into structured data"""
-        data = []
-
-        for line in self.csv_lines[1:]:  # Skip header line
-            parts = line.split(',')
-            if len(parts) >= 4:
-                try:
-                    dut = int(parts[0])
-                    freq = float(parts[1])
-                    magnitude = float(parts[2])
-                    phase = float(parts[3])
-
-                    data.append({
-                        'dut': dut,
-                        'frequency': freq,
-                        'magnitude': magnitude,
-                        'phase': phase
-                    })
-                except ValueError:
-                    continue
-
-        return data
+        """Parse CSV lines into column arrays (dut, frequency, magnitude, phase)"""
+        return parse_impedance_rows(self.csv_lines[1:])  # Skip header line
 
     def save_data(self, save_csv=True):
         """Prompt for filename and save CSV and/or .pssession files"""
@@ -116,8 +281,7 @@ class ESP32DataCapture:
             csv_path = f"{filename}.csv"
             try:
                 with open(csv_path, 'w') as f:
-                    for line in self.csv_lines:
-                        f.write(line + '\n')
+                    f.write('\n'.join(self.csv_lines) + '\n')
                 print(f"✓ Saved CSV to: {csv_path}")
             except Exception as e:
                 print(f"ERROR: Failed to save CSV: {e}")
@@ -125,7 +289,7 @@ class ESP32DataCapture:
 
         # Parse data and create .pssession file
         data = self.parse_csv_data()
-        if data:
+        if len(data['dut']) > 0:
             pssession_path = f"{filename}.pssession"
             self.create_pssession_file(data, pssession_path)
         else:
@@ -133,19 +297,22 @@ class ESP32DataCapture:
 
     def create_pssession_file(self, data, filepath):
         """Create PS Trace .pssession file from impedance data"""
-        # Group data by DUT
-        dut_groups = {}
-        for point in data:
-            dut = point['dut']
-            if dut not in dut_groups:
-                dut_groups[dut] = []
-            dut_groups[dut].append(point)
+        dut = data['dut']
+        if (dut == dut[0]).all():
+            # Single DUT: the rows are already one group
+            columns = data
+            dut_nums, dut_starts = dut[:1], np.array([0])
+        else:
+            # Group data by DUT: a stable sort keeps each DUT's rows in file order
+            order = np.argsort(dut, kind='stable')
+            columns = {name: col[order] for name, col in data.items()}
+            dut_nums, dut_starts = np.unique(columns['dut'], return_index=True)
 
         # Get frequency range from data
-        all_freqs = [p['frequency'] for p in data]
-        freq_min = min(all_freqs)
-        freq_max = max(all_freqs)
-        num_freqs = len(set(all_freqs))
+        all_freqs = data['frequency']
+        freq_min = all_freqs.min()
+        freq_max = all_freqs.max()
+        num_freqs = np.unique(all_freqs).size
 
         # Create method string (simplified version)
         method_str = f"""#PSTrace, Version=5.8.1704.29098
@@ -160,169 +327,46 @@ NUM_FREQS={num_freqs}
 AMPLITUDE=1.000E-002
 """
 
-        # Create PS Trace compatible structure matching the actual format
-        pssession = {
-            "type": "PalmSens.DataFiles.SessionFile",
-            "coreversion": "5.8.1704.29098",
-            "methodformeasurement": method_str,
-            "measurements": []
+        # Fill the PS Trace JSON templates directly; the constant structure
+        # is never built as Python dicts
+        timestamp = int(datetime.now().timestamp() * 10000000)  # .NET ticks approximation
+        method_json = dump_json(method_str)
+
+        # Fill the per-file fields once, leaving only the DUT number and dataset
+        measurement_template = MEASUREMENT_TEMPLATE % {
+            'dut': '%(dut)s',
+            'timestamp': timestamp,
+            'dataset': '%(dataset)s',
+            'method': method_json.replace('%', '%%')
         }
 
-        # Create measurement for each DUT
-        for dut_num in sorted(dut_groups.keys()):
-            dut_data = dut_groups[dut_num]
-
-            # Build data arrays
-            freq_datavalues = []
-            z_re_datavalues = []
-            z_im_datavalues = []
-            z_mag_datavalues = []
-            z_phase_datavalues = []
-            idc_datavalues = []
-            potential_datavalues = []
-            time_datavalues = []
-            iac_datavalues = []
-
-            for point in dut_data:
-                freq = point['frequency']
-                mag = point['magnitude']
-                phase_deg = point['phase']
-                phase_rad = math.radians(phase_deg)
-
-                # Calculate ZRe and ZIm from magnitude and phase
-                # Z = |Z| * e^(j*phase)
-                # Re(Z) = |Z| * cos(phase)
-                # Im(Z) = |Z| * sin(phase) (note: positive for phase)
-                z_re = mag * math.cos(phase_rad)
-                z_im = mag * math.sin(phase_rad)
-
-                # Calculate Iac from Z magnitude (assuming 10mV AC amplitude)
-                amplitude_v = 0.01  # 10mV
-                i_ac = (amplitude_v / mag) * 1e6 if mag > 0 else 0  # Convert to µA
-
-                freq_datavalues.append({"v": freq})
-                z_re_datavalues.append({"v": z_re})
-                z_im_datavalues.append({"v": z_im})
-                z_mag_datavalues.append({"v": mag})
-                z_phase_datavalues.append({"v": phase_deg})
-
-                # Mock current/potential/time data (required by PS Trace)
-                idc_datavalues.append({"v": 0.0, "c": 3, "s": 0})
-                potential_datavalues.append({"v": 0.0, "s": 0, "r": 3})
-                time_datavalues.append({"v": 0.0001})
-                iac_datavalues.append({"v": i_ac, "c": 3, "s": 0})
-
-            # Build dataset with proper PalmSens structure
-            dataset = {
-                "type": "PalmSens.Data.DataSetEIS",
-                "values": [
-                    # Array 0: Idc
-                    {
-                        "type": "PalmSens.Data.DataArrayCurrents",
-                        "arraytype": 2,
-                        "description": "Idc",
-                        "unit": {"type": "PalmSens.Units.MicroAmpere", "s": "A", "q": "Current", "a": "i"},
-                        "datavalues": idc_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValueCurrentRange"
-                    },
-                    # Array 1: potential
-                    {
-                        "type": "PalmSens.Data.DataArrayPotentials",
-                        "arraytype": 1,
-                        "description": "potential",
-                        "unit": {"type": "PalmSens.Units.Volt", "s": "V", "q": "Potential", "a": "E"},
-                        "datavalues": potential_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValueGainRange"
-                    },
-                    # Array 2: time
-                    {
-                        "type": "PalmSens.Data.DataArrayTime",
-                        "arraytype": 0,
-                        "description": "time",
-                        "unit": {"type": "PalmSens.Units.Time", "s": "s", "q": "Time", "a": "t"},
-                        "datavalues": time_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-                    },
-                    # Array 3: Frequency
-                    {
-                        "type": "PalmSens.Data.DataArray",
-                        "arraytype": 5,
-                        "description": "Frequency",
-                        "unit": {"type": "PalmSens.Units.Hertz", "s": "Hz", "q": "Frequency", "a": "f"},
-                        "datavalues": freq_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-                    },
-                    # Array 4: ZRe
-                    {
-                        "type": "PalmSens.Data.DataArray",
-                        "arraytype": 7,
-                        "description": "ZRe",
-                        "unit": {"type": "PalmSens.Units.ZRe", "s": "Ω", "q": "Z'", "a": "Z"},
-                        "datavalues": z_re_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-                    },
-                    # Array 5: ZIm
-                    {
-                        "type": "PalmSens.Data.DataArray",
-                        "arraytype": 8,
-                        "description": "ZIm",
-                        "unit": {"type": "PalmSens.Units.ZIm", "s": "Ω", "q": "-Z''", "a": "Z"},
-                        "datavalues": z_im_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-                    },
-                    # Array 6: Z (magnitude)
-                    {
-                        "type": "PalmSens.Data.DataArray",
-                        "arraytype": 10,
-                        "description": "Z",
-                        "unit": {"type": "PalmSens.Units.Z", "s": "Ω", "q": "Z", "a": "Z"},
-                        "datavalues": z_mag_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-                    },
-                    # Array 7: Phase
-                    {
-                        "type": "PalmSens.Data.DataArray",
-                        "arraytype": 6,
-                        "description": "Phase",
-                        "unit": {"type": "PalmSens.Units.Phase", "s": "°", "q": "-Phase", "a": "Phase"},
-                        "datavalues": z_phase_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-                    },
-                    # Array 8: Iac
-                    {
-                        "type": "PalmSens.Data.DataArrayCurrents",
-                        "arraytype": 9,
-                        "description": "Iac",
-                        "unit": {"type": "PalmSens.Units.MicroAmpere", "s": "A", "q": "Current", "a": "i"},
-                        "datavalues": iac_datavalues,
-                        "datavaluetype": "PalmSens.Data.DataValue.DataValueCurrentRange"
-                    }
-                ]
-            }
+        # Build each DUT's dataset from its slice of the columns
+        freqs = np.split(columns['frequency'], dut_starts[1:])
+        mags = np.split(columns['magnitude'], dut_starts[1:])
+        phases = np.split(columns['phase'], dut_starts[1:])
+        datasets = [build_dataset_json(f, m, p) for f, m, p in zip(freqs, mags, phases)]
 
-            measurement = {
-                "title": f"DUT {dut_num}",
-                "timestamp": int(datetime.now().timestamp() * 10000000),  # .NET ticks approximation
-                "utctimestamp": int(datetime.now().timestamp() * 10000000),
-                "deviceused": 0,
-                "deviceserial": "BioPal-ESP32",
-                "devicefw": "1.0",
-                "type": ".",
-                "dataset": dataset,
-                "method": method_str,
-                "curves": [],
-                "eisdatalist": []
-            }
-
-            pssession["measurements"].append(measurement)
+        # Create measurement for each DUT
+        measurements = [measurement_template % {'dut': dut_num, 'dataset': dataset}
+                        for dut_num, dataset in zip(dut_nums.tolist(), datasets)]
 
-        # Save as UTF-16 LE encoded JSON with BOM
+        # Save as UTF-16 LE encoded JSON with BOM, one measurement at a time
         try:
-            json_str = json.dumps(pssession, indent=2)
             # Add BOM at start, write JSON, add BOM at end (matching original format)
-            with open(filepath, 'w', encoding='utf-16-le') as f:
+            with open(filepath, 'w', encoding='utf-16-le', newline='') as f:
                 f.write('\ufeff')  # BOM
-                f.write(json_str)
+                head = SESSION_HEAD_TEMPLATE % {'method': method_json}
+                if self.indent is not None:
+                    # Re-encode the compact document for human inspection
+                    text = head + ','.join(measurements) + ']}'
+                    json.dump(json.loads(text), f, indent=self.indent, ensure_ascii=False)
+                else:
+                    f.write(head)
+                    for i, measurement in enumerate(measurements):
+                        if i:
+                            f.write(',')
+                        f.write(measurement)
+                    f.write(']}')
                 f.write('\ufeff')  # BOM at end
             print(f"✓ Saved .pssession to: {filepath}")
         except Exception as e:
@@ -363,7 +407,9 @@ AMPLITUDE=1.000E-002
         import threading
         import queue
 
-        input_queue = queue.Queue()
+        # Input and serial lines share one queue so the main loop can block
+        # on a single get() instead of polling both sources
+        events = queue.Queue()
         running = True
 
         def input_thread():
@@ -371,53 +417,83 @@ AMPLITUDE=1.000E-002
             while running:
                 try:
                     line = input()
-                    input_queue.put(line)
+                    events.put(('input', line))
                 except EOFError:
                     break
 
-        # Start input thread
+        def serial_thread():
+            """Thread to read serial data and queue complete lines in batches"""
+            buf = bytearray()
+            while running:
+                try:
+                    buf += self.ser.read(max(1, self.ser.in_waiting))
+                except Exception as e:
+                    if running:
+                        events.put(('error', e))
+                    break
+                # Decode every complete line received so far in one go and
+                # queue them as a single batch
+                end = buf.rfind(b'\n') + 1
+                if end:
+                    text = buf[:end].decode('utf-8', errors='ignore')
+                    del buf[:end]
+                    events.put(('serial', LINE_RE.findall(text)))
+
+        # The reader blocks in read() until data arrives (the OS wakes it, no
+        # polling); cancel_read() releases it on shutdown
+        self.ser.timeout = None
+
+        # Start input and serial reader threads
         thread = threading.Thread(target=input_thread, daemon=True)
         thread.start()
+        reader = threading.Thread(target=serial_thread, daemon=True)
+        reader.start()
+
+        # Mirror serial output through a block-buffered stdout, flushing once
+        # the queue drains instead of on every line
+        line_buffered = getattr(sys.stdout, 'line_buffering', False)
+        if line_buffered:
+            sys.stdout.reconfigure(line_buffering=False)
 
         # Main loop
         try:
             while True:
-                # Check for user input from queue
                 try:
-                    line = input_queue.get_nowait()
+                    source, payload = events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
 
-                    if line.lower() == 'quit':
+                if source == 'serial':
+                    for line in payload:
+                        self.process_line(line)
+                elif source == 'input':
+                    if payload.lower() == 'quit':
                         print("\nExiting...")
                         break
 
-                    if line:
-                        self.send_command(line)
-                except queue.Empty:
-                    pass
-
-                # Read from serial port
-                if self.ser.in_waiting > 0:
-                    try:
-                        line = self.ser.readline().decode('utf-8', errors='ignore')
-                        self.process_line(line)
-                    except Exception as e:
-                        print(f"ERROR reading serial: {e}")
+                    if payload:
+                        self.send_command(payload)
+                else:
+                    print(f"ERROR reading serial: {payload}")
 
-                # Small delay to prevent CPU spinning
-                import time
-                time.sleep(0.01)
+                if events.empty():
+                    sys.stdout.flush()
 
         except KeyboardInterrupt:
             print("\n\nInterrupted by user")
 
         finally:
             running = False
+            self.ser.cancel_read()
+            reader.join(timeout=1)
+            if line_buffered:
+                sys.stdout.reconfigure(line_buffering=True)
             if self.ser and self.ser.is_open:
                 self.ser.close()
                 print("Serial port closed")
 
 
-def convert_csv_to_pssession(csv_filepath):
+def convert_csv_to_pssession(csv_filepath, indent=None):
     """Convert existing CSV file to .pssession format"""
     print(f"\n=== Converting CSV to .pssession ===")
     print(f"Input file: {csv_filepath}")
@@ -427,53 +503,36 @@ def convert_csv_to_pssession(csv_filepath):
         print(f"ERROR: File not found: {csv_filepath}")
         return
 
-    # Read CSV file
+    # Read CSV file: the header line, then all data rows in a single read
+    # (np.loadtxt skips the blank ones)
     try:
         with open(csv_filepath, 'r') as f:
-            lines = f.readlines()
+            header = f.readline()
+            while header and not header.strip():
+                header = f.readline()
+            header = header.strip()
+            lines = f.read().splitlines()
     except Exception as e:
         print(f"ERROR: Failed to read CSV file: {e}")
         return
 
-    # Remove any whitespace and filter empty lines
-    csv_lines = [line.strip() for line in lines if line.strip()]
-
-    if not csv_lines or len(csv_lines) < 2:
+    if not header or not any(line.strip() for line in lines):
         print("ERROR: CSV file is empty or has no data")
         return
 
     # Validate header
-    header = csv_lines[0]
     if not header.startswith("DUT,Frequency"):
         print(f"WARNING: Unexpected CSV header: {header}")
         print("Expected format: DUT,Frequency_Hz,Magnitude_Ohms,Phase_Deg")
 
     # Parse CSV data
-    data = []
-    for line in csv_lines[1:]:  # Skip header
-        parts = line.split(',')
-        if len(parts) >= 4:
-            try:
-                dut = int(parts[0])
-                freq = float(parts[1])
-                magnitude = float(parts[2])
-                phase = float(parts[3])
-
-                data.append({
-                    'dut': dut,
-                    'frequency': freq,
-                    'magnitude': magnitude,
-                    'phase': phase
-                })
-            except ValueError:
-                print(f"WARNING: Skipping invalid line: {line}")
-                continue
+    data = parse_impedance_rows(lines, warn_invalid=True)
 
-    if not data:
+    if len(data['dut']) == 0:
         print("ERROR: No valid data found in CSV file")
         return
 
-    print(f"✓ Parsed {len(data)} data points from CSV")
+    print(f"✓ Parsed {len(data['dut'])} data points from CSV")
 
     # Determine output filename
     base_name = os.path.splitext(csv_filepath)[0]
@@ -487,7 +546,7 @@ def convert_csv_to_pssession(csv_filepath):
             return
 
     # Create .pssession file
-    capture = ESP32DataCapture()
+    capture = ESP32DataCapture(indent=indent)
     capture.create_pssession_file(data, output_path)
 
     print(f"\n✓ Conversion complete!")
@@ -513,16 +572,18 @@ Examples:
     )
     parser.add_argument('-c', '--convert', metavar='CSV_FILE',
                         help='Convert existing CSV file to .pssession format')
+    parser.add_argument('--indent', type=int, metavar='N',
+                        help='Pretty-print .pssession JSON with N-space indent (debugging)')
 
     args = parser.parse_args()
 
     try:
         if args.convert:
             # Convert mode
-            convert_csv_to_pssession(args.convert)
+            convert_csv_to_pssession(args.convert, indent=args.indent)
         else:
             # Live capture mode
-            capture = ESP32DataCapture()
+            capture = ESP32DataCapture(indent=args.indent)
             capture.run()
     except Exception as e:
         print(f"FATAL ERROR: {e}")
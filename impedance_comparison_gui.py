@@ -5,31 +5,167 @@ Compares PalmSens PS Trace data with BioPal ESP32 data
 Shows Bode plots and percentage error analysis
 """
 
-import matplotlib.pyplot as plt
 import numpy as np
-import csv
 import sys
 import os
-import tkinter as tk
-from tkinter import filedialog
+import warnings
+import zipfile
+
+# BioPal CSVs are written by the capture tool; parse them the same way
+from esp32_data_capture import parse_impedance_rows
+
+# Optional: compiled build of the kernels below (python _fastpaths.py);
+# without it the numpy equivalents are used
+try:
+    import impedance_fast
+except ImportError:
+    impedance_fast = None
+
+# Bump when the parsers or the .npz cache layout change
+NPZ_CACHE_VERSION = 2
+
+
+def wrap_phase(phase):
+    """Bring phases (degrees) into -180..+180 by whole turns; in-range values are untouched"""
+    # Same result as repeatedly adding/subtracting 360, but bounded work per value
+    phase = np.array(phase, dtype=np.float64)
+    high = phase > 180
+    phase[high] -= 360 * np.ceil((phase[high] - 180) / 360)
+    low = phase < -180
+    phase[low] += 360 * np.ceil((-180 - phase[low]) / 360)
+    return phase
+
+
+def _interp2_kernel(x, xp, fp1, fp2):
+    """Interpolate two value arrays at x with one search per point (np.interp arithmetic)"""
+    n = len(xp)
+    out1 = np.empty(len(x))
+    out2 = np.empty(len(x))
+    j = 0
+    for i in range(len(x)):
+        xi = x[i]
+        if xi < xp[0]:
+            out1[i] = fp1[0]
+            out2[i] = fp2[0]
+            continue
+        if xi > xp[n - 1]:
+            out1[i] = fp1[n - 1]
+            out2[i] = fp2[n - 1]
+            continue
+        # Sorted queries usually land in the same or the next interval as the
+        # previous one; only binary search on a miss
+        if j < n - 1 and xp[j] <= xi < xp[j + 1]:
+            pass
+        elif j < n - 2 and xp[j + 1] <= xi < xp[j + 2]:
+            j += 1
+        else:
+            j = np.searchsorted(xp, xi, side='right') - 1
+        if j >= n - 1 or xi == xp[j]:
+            out1[i] = fp1[j]
+            out2[i] = fp2[j]
+            continue
+        dx = xi - xp[j]
+        width = xp[j + 1] - xp[j]
+        out1[i] = (fp1[j + 1] - fp1[j]) / width * dx + fp1[j]
+        out2[i] = (fp2[j + 1] - fp2[j]) / width * dx + fp2[j]
+    return out1, out2
+
+
+def interp2(x, xp, fp1, fp2):
+    """np.interp of two value arrays over the same sample points"""
+    if len(xp) < 2 or impedance_fast is None:
+        return np.interp(x, xp, fp1), np.interp(x, xp, fp2)
+    return impedance_fast.interp2(x, xp, fp1, fp2)
+
+
+def _error_stats_kernel(a):
+    """Mean, population std and max |a| in one pass (Welford update for the variance)"""
+    total = 0.0
+    mean = 0.0
+    m2 = 0.0
+    max_abs = 0.0
+    for i in range(a.size):
+        v = a[i]
+        total += v
+        delta = v - mean
+        mean += delta / (i + 1)
+        m2 += delta * (v - mean)
+        av = abs(v)
+        if av > max_abs or av != av:  # Let NaN propagate like np.max
+            max_abs = av
+    # The plain sum gives a mean closer to np.mean than the running one
+    return total / a.size, np.sqrt(m2 / a.size), max_abs
+
+
+def error_stats(a):
+    """(mean, std, max abs) of an error array"""
+    if a.size == 0 or impedance_fast is None:
+        return np.mean(a), np.std(a), np.max(np.abs(a))
+    return impedance_fast.error_stats(a)
+
 
 class ImpedanceComparison:
-    def __init__(self):
+    def __init__(self, use_cache=True):
         self.ps_data = None
         self.bp_data = None
+        # Keep parsed data in <file>.npz next to each CSV for faster re-runs
+        self.use_cache = use_cache
+
+    def _load_cache(self, filepath, kind):
+        """Parsed data from filepath's .npz cache, or None if missing, stale or
+        written by another parser (kind) or cache version"""
+        cache = filepath + '.npz'
+        if not self.use_cache or not os.path.exists(cache):
+            return None
+        if os.path.getmtime(cache) <= os.path.getmtime(filepath):
+            return None
+        try:
+            with np.load(cache) as d:
+                if d['version'] != NPZ_CACHE_VERSION or d['kind'] != kind:
+                    return None
+                data = {'freq': d['freq'], 'z_mag': d['z_mag'], 'phase': d['phase']}
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+        print(f"  ✓ Loaded {len(data['freq'])} data points from cache {cache}")
+        self._print_ranges(data['freq'], data['z_mag'], data['phase'])
+        return data
+
+    def _save_cache(self, filepath, kind, data):
+        """Write parsed data to filepath's .npz cache (skipped if not writable)"""
+        if not self.use_cache:
+            return
+        cache = filepath + '.npz'
+        tmp = cache + '.tmp'
+        try:
+            # Through a file object so np.savez doesn't append another .npz.
+            # Renamed into place, so an interrupted run can't leave a truncated cache
+            with open(tmp, 'wb') as f:
+                np.savez(f, version=NPZ_CACHE_VERSION, kind=kind,
+                         freq=data['freq'], z_mag=data['z_mag'], phase=data['phase'])
+            os.replace(tmp, cache)
+        except OSError:
+            pass
 
     def parse_palmsens_csv(self, filepath):
         """Parse PalmSens PS Trace CSV format (supports multiple runs for averaging)"""
         print(f"Loading PalmSens CSV: {filepath}")
 
-        # Try different encodings (UTF-16 first as PalmSens often uses it)
+        cached = self._load_cache(filepath, 'palmsens')
+        if cached is not None:
+            return cached
+
+        # Try the encoding sniffed from the file's first bytes, then the others
+        # (UTF-16 first as PalmSens often uses it)
         # Note: latin-1 must be last as it accepts almost anything but may mangle text
-        for encoding in ['utf-16', 'utf-16-le', 'utf-8-sig', 'utf-8', 'latin-1']:
+        sniffed = self._sniff_encoding(filepath)
+        encodings = ['utf-16', 'utf-16-le', 'utf-8-sig', 'utf-8', 'latin-1']
+        encodings.remove(sniffed)
+        for encoding in [sniffed] + encodings:
             try:
                 with open(filepath, 'r', encoding=encoding) as f:
-                    lines = f.readlines()
+                    sections, head_lines, found_freq = self._read_sections(f)
                 # Verify we got actual text (not mangled)
-                if lines and any('freq' in line.lower() for line in lines):
+                if found_freq:
                     print(f"  Successfully decoded with {encoding} encoding")
                     break
             except (UnicodeDecodeError, UnicodeError):
@@ -37,78 +173,26 @@ class ImpedanceComparison:
         else:
             raise ValueError("Could not decode CSV file with any known encoding")
 
-        # Find all data sections (multiple runs)
+        # One data section per run
         all_runs = []
-        i = 0
-
-        while i < len(lines):
-            line_lower = lines[i].lower()
-            # Look for header with freq/hz AND (phase OR z/impedance)
-            if ('freq' in line_lower and 'hz' in line_lower and
-                ('phase' in line_lower or 'z' in line_lower or 'ohm' in line_lower)):
-
-                print(f"  Found data section header at line {i+1}")
-
-                # Found a data section header, parse this run
-                run_freq = []
-                run_z_mag = []
-                run_phase = []
-                i += 1  # Move to first data line
-
-                while i < len(lines):
-                    line = lines[i].strip()
-
-                    # Check if we hit another header (new run) or end of data
-                    line_lower = line.lower()
-                    if ('freq' in line_lower and 'hz' in line_lower and
-                        ('phase' in line_lower or 'z' in line_lower or 'ohm' in line_lower)):
-                        # Found next run header, don't increment i
-                        break
-
-                    # Skip empty lines, BOM characters, or lines with only commas
-                    if not line or line.startswith('\ufeff') or line.startswith('�') or line.replace(',', '').strip() == '':
-                        i += 1
-                        continue
-
-                    parts = [p.strip() for p in line.split(',')]
-                    if len(parts) < 4:
-                        i += 1
-                        continue
-
-                    try:
-                        # Column 0: Frequency
-                        # Column 1: Phase (negative)
-                        # Column 3: Z magnitude
-                        f = float(parts[0])
-                        p = float(parts[1])
-                        z = float(parts[3])
-
-                        # Skip if frequency or impedance is 0 or negative
-                        if f <= 0 or z <= 0:
-                            i += 1
-                            continue
-
-                        run_freq.append(f)
-                        run_phase.append(-p)  # Negate the phase
-                        run_z_mag.append(z)
-                    except (ValueError, IndexError):
-                        pass
-
-                    i += 1
-
-                if run_freq:
-                    all_runs.append({
-                        'freq': run_freq,
-                        'z_mag': run_z_mag,
-                        'phase': run_phase
-                    })
-            else:
-                i += 1
+
+        for header_line, rows in sections:
+            print(f"  Found data section header at line {header_line}")
+
+            # Skip if frequency or impedance is 0 or negative
+            rows = rows[~((rows[:, 0] <= 0) | (rows[:, 2] <= 0))]
+
+            if len(rows):
+                all_runs.append({
+                    'freq': rows[:, 0],
+                    'z_mag': rows[:, 2],
+                    'phase': -rows[:, 1]  # Negate the phase
+                })
 
         if len(all_runs) == 0:
             print("  ERROR: Could not find data header in PalmSens CSV")
             print(f"  First 10 lines of file:")
-            for i, line in enumerate(lines[:10]):
+            for i, line in enumerate(head_lines):
                 print(f"    Line {i+1}: {line.strip()[:80]}")
             raise ValueError("Could not find data header in PalmSens CSV")
 
@@ -121,107 +205,163 @@ class ImpedanceComparison:
             averaged_data = self._average_palmsens_runs(all_runs)
             print(f"  ✓ Loaded and averaged {len(averaged_data['freq'])} data points")
         else:
-            freq = np.array(all_runs[0]['freq'])
-            z_mag = np.array(all_runs[0]['z_mag'])
-            phase = np.array(all_runs[0]['phase'])
+            # Sort by frequency so it can be windowed and interpolated against
+            run = all_runs[0]
+            order = np.argsort(run['freq'], kind='stable')
+            freq = run['freq'][order]
+            z_mag = run['z_mag'][order]
+            phase = run['phase'][order]
 
             # Normalize phase to -180 to +180
-            phase = np.arctan2(np.sin(np.radians(phase)), np.cos(np.radians(phase)))
-            phase = np.degrees(phase)
+            phase = wrap_phase(phase)
 
             averaged_data = {'freq': freq, 'z_mag': z_mag, 'phase': phase}
             print(f"  ✓ Loaded {len(freq)} data points")
 
         # Print data range for debugging
-        print(f"  Frequency range: {averaged_data['freq'].min():.1f} Hz to {averaged_data['freq'].max():.1f} Hz")
-        print(f"  Magnitude range: {averaged_data['z_mag'].min():.1f} Ω to {averaged_data['z_mag'].max():.1f} Ω")
-        print(f"  Phase range: {averaged_data['phase'].min():.2f}° to {averaged_data['phase'].max():.2f}°")
+        self._print_ranges(averaged_data['freq'], averaged_data['z_mag'], averaged_data['phase'])
 
+        self._save_cache(filepath, 'palmsens', averaged_data)
         return averaged_data
 
+    @staticmethod
+    def _print_ranges(freq, z_mag, phase):
+        """Print frequency/magnitude/phase ranges, reducing all three columns together"""
+        columns = np.stack([freq, z_mag, phase])
+        (f_min, z_min, p_min), (f_max, z_max, p_max) = columns.min(axis=1), columns.max(axis=1)
+        print(f"  Frequency range: {f_min:.1f} Hz to {f_max:.1f} Hz")
+        print(f"  Magnitude range: {z_min:.1f} Ω to {z_max:.1f} Ω")
+        print(f"  Phase range: {p_min:.2f}° to {p_max:.2f}°")
+
+    @staticmethod
+    def _sniff_encoding(filepath):
+        """Guess a CSV's encoding from its BOM, or NUL bytes for BOM-less UTF-16"""
+        with open(filepath, 'rb') as f:
+            head = f.read(4096)
+        if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+            return 'utf-16'
+        if head.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
+        if head.count(b'\x00') > len(head) // 4:
+            return 'utf-16-le'
+        return 'utf-8'
+
+    @staticmethod
+    def _is_data_header(line_lower):
+        """Header row: mentions freq/hz AND (phase OR z/impedance)"""
+        return ('freq' in line_lower and 'hz' in line_lower and
+                ('phase' in line_lower or 'z' in line_lower or 'ohm' in line_lower))
+
+    def _read_sections(self, f):
+        """Stream a decoded CSV, parsing each run's section as it ends; returns (sections, first lines, found freq)"""
+        sections = []
+        head_lines = []
+        found_freq = False
+        header_line = None
+        data_lines = []
+
+        for line_num, line in enumerate(f, 1):
+            if line_num <= 10:
+                head_lines.append(line)
+            line_lower = line.lower()
+            if 'freq' in line_lower:
+                found_freq = True
+                # A new header ends the previous run
+                if self._is_data_header(line_lower):
+                    if header_line is not None:
+                        sections.append((header_line, self._parse_section(data_lines)))
+                    header_line = line_num
+                    data_lines = []
+                    continue
+            if header_line is not None:
+                data_lines.append(line)
+
+        if header_line is not None:
+            sections.append((header_line, self._parse_section(data_lines)))
+        return sections, head_lines, found_freq
+
+    @staticmethod
+    def _parse_section(data_lines):
+        """Parse one run's data rows into an (N, 3) array of (freq, neg_phase, Z)"""
+        # Columns: 0 = frequency, 1 = phase (negative), 3 = Z magnitude
+        try:
+            # The BOM is the comment marker, which skips the stray one at the end
+            # of a PS Trace file
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')  # Empty data warning
+                return np.loadtxt(data_lines, delimiter=',', usecols=(0, 1, 3), comments='\ufeff',
+                                  dtype=np.float64, ndmin=2)
+        except ValueError:
+            pass
+
+        # Skip empty lines, BOM characters, lines with only commas, short or non-numeric rows
+        rows = np.empty((len(data_lines), 3), dtype=np.float64)
+        n_valid = 0
+        for line in data_lines:
+            parts = line.split(',', 4)  # Only the first four fields are used; float() strips whitespace
+            if len(parts) < 4:
+                continue
+            try:
+                rows[n_valid] = (float(parts[0]), float(parts[1]), float(parts[3]))
+            except ValueError:
+                continue
+            n_valid += 1
+        return rows[:n_valid]
+
     def _average_palmsens_runs(self, runs):
         """Average multiple PalmSens measurement runs using circular mean for phase"""
-        # Group measurements by frequency
-        freq_to_measurements = {}
-
-        for run in runs:
-            for f, z, p in zip(run['freq'], run['z_mag'], run['phase']):
-                freq_hz = int(f)  # Round to integer for grouping
-                if freq_hz not in freq_to_measurements:
-                    freq_to_measurements[freq_hz] = {'freq': [], 'z_mag': [], 'phase': []}
-                freq_to_measurements[freq_hz]['freq'].append(f)
-                freq_to_measurements[freq_hz]['z_mag'].append(z)
-                freq_to_measurements[freq_hz]['phase'].append(p)
-
-        # Average each frequency
-        freq = []
-        z_mag = []
-        phase = []
-
-        for freq_hz in sorted(freq_to_measurements.keys()):
-            measurements = freq_to_measurements[freq_hz]
-
-            # Average frequency and magnitude (arithmetic mean)
-            avg_freq = np.mean(measurements['freq'])
-            avg_magnitude = np.mean(measurements['z_mag'])
-
-            # Average phase (circular mean)
-            phases = measurements['phase']
-            angles_rad = np.radians(phases)
-            sin_mean = np.mean(np.sin(angles_rad))
-            cos_mean = np.mean(np.cos(angles_rad))
-            avg_phase = np.degrees(np.arctan2(sin_mean, cos_mean))
-
-            freq.append(avg_freq)
-            z_mag.append(avg_magnitude)
-            phase.append(avg_phase)
+        freq_all = np.concatenate([run['freq'] for run in runs])
+        z_all = np.concatenate([run['z_mag'] for run in runs])
+        phase_all = np.concatenate([run['phase'] for run in runs])
+
+        # Group measurements by frequency, rounded to integer Hz (sorted by np.unique)
+        _, group, counts = np.unique(freq_all.astype(np.int64), return_inverse=True, return_counts=True)
+
+        # Average frequency and magnitude (arithmetic mean)
+        freq = np.bincount(group, weights=freq_all) / counts
+        z_mag = np.bincount(group, weights=z_all) / counts
+
+        # Average phase (circular mean)
+        angles_rad = np.radians(phase_all)
+        sin_mean = np.bincount(group, weights=np.sin(angles_rad)) / counts
+        cos_mean = np.bincount(group, weights=np.cos(angles_rad)) / counts
+        phase = np.degrees(np.arctan2(sin_mean, cos_mean))
 
         return {
-            'freq': np.array(freq),
-            'z_mag': np.array(z_mag),
-            'phase': np.array(phase)
+            'freq': freq,
+            'z_mag': z_mag,
+            'phase': phase
         }
 
     def parse_biopal_csv(self, filepath):
         """Parse BioPal CSV format"""
         print(f"Loading BioPal CSV: {filepath}")
 
-        freq = []
-        z_mag = []
-        phase = []
-        skipped = 0
+        cached = self._load_cache(filepath, 'biopal')
+        if cached is not None:
+            return cached
 
         with open(filepath, 'r') as f:
-            reader = csv.reader(f)
-            header = next(reader)  # Skip header
+            lines = f.readlines()
 
-            for row in reader:
-                if len(row) < 4:
-                    continue
+        # DUT, Frequency, Magnitude, Phase; the header line is skipped
+        rows = parse_impedance_rows(lines[1:], warn_invalid=True)
+        freq = rows['frequency']
+        z_mag = rows['magnitude']
 
-                try:
-                    # DUT, Frequency, Magnitude, Phase
-                    f = float(row[1])
-                    z = float(row[2])
-                    p = float(row[3])
-
-                    # Skip invalid data points
-                    if f <= 0 or z <= 0:
-                        skipped += 1
-                        continue
-
-                    # Normalize phase to -180 to +180 range
-                    while p > 180:
-                        p -= 360
-                    while p < -180:
-                        p += 360
-
-                    freq.append(f)
-                    z_mag.append(z)
-                    phase.append(p)
-                except (ValueError, IndexError):
-                    skipped += 1
-                    continue
+        # Skip invalid data points
+        invalid = (freq <= 0) | (z_mag <= 0)
+        skipped = int(np.count_nonzero(invalid))
+
+        # Sort by frequency: np.interp needs increasing sample points
+        keep = np.flatnonzero(~invalid)
+        keep = keep[np.argsort(freq[keep], kind='stable')]
+
+        freq = freq[keep]
+        z_mag = z_mag[keep]
+
+        # Normalize phase to -180 to +180 range
+        phase = wrap_phase(rows['phase'][keep])
 
         if len(freq) == 0:
             raise ValueError("No valid data found in BioPal CSV")
@@ -231,15 +371,15 @@ class ImpedanceComparison:
             print(f"  ⚠ Skipped {skipped} invalid data points (freq=0 or magnitude=0)")
 
         # Print data range for debugging
-        print(f"  Frequency range: {min(freq):.1f} Hz to {max(freq):.1f} Hz")
-        print(f"  Magnitude range: {min(z_mag):.1f} Ω to {max(z_mag):.1f} Ω")
-        print(f"  Phase range: {min(phase):.2f}° to {max(phase):.2f}°")
+        self._print_ranges(freq, z_mag, phase)
 
-        return {
-            'freq': np.array(freq),
-            'z_mag': np.array(z_mag),
-            'phase': np.array(phase)
+        data = {
+            'freq': freq,
+            'z_mag': z_mag,
+            'phase': phase
         }
+        self._save_cache(filepath, 'biopal', data)
+        return data
 
     def compare_and_plot(self, ps_file, bp_file):
         """Load data, compare, and plot results"""
@@ -253,54 +393,66 @@ class ImpedanceComparison:
 
         print(f"\nCommon frequency range: {freq_min:.1f} Hz to {freq_max:.1f} Hz")
 
-        # Use PalmSens frequencies as reference (ground truth)
-        freq_common_mask = (self.ps_data['freq'] >= freq_min) & (self.ps_data['freq'] <= freq_max)
-        freq_common = self.ps_data['freq'][freq_common_mask]
+        # Use PalmSens frequencies as reference (ground truth); they are sorted
+        # at load, so the window is a slice (views, no copies)
+        ps_freq = self.ps_data['freq']
+        window = slice(np.searchsorted(ps_freq, freq_min, side='left'),
+                       np.searchsorted(ps_freq, freq_max, side='right'))
+        freq_common = ps_freq[window]
 
         if len(freq_common) < 2:
             raise ValueError("Insufficient overlapping frequency range between datasets")
 
-        # Interpolate BioPal data to match PalmSens frequencies
-        bp_z_interp = np.interp(freq_common, self.bp_data['freq'], self.bp_data['z_mag'])
-        bp_phase_interp = np.interp(freq_common, self.bp_data['freq'], self.bp_data['phase'])
+        # Interpolate BioPal data to match PalmSens frequencies; sweeps are
+        # log-spaced, so interpolate along log10(f) (exact at shared frequencies)
+        bp_z_interp, bp_phase_interp = interp2(np.log10(freq_common), np.log10(self.bp_data['freq']),
+                                               self.bp_data['z_mag'], self.bp_data['phase'])
 
         # Get corresponding PalmSens data
-        ps_z = self.ps_data['z_mag'][freq_common_mask]
-        ps_phase = self.ps_data['phase'][freq_common_mask]
+        ps_z = self.ps_data['z_mag'][window]
+        ps_phase = self.ps_data['phase'][window]
 
         # Calculate percentage errors
-        z_error = ((bp_z_interp - ps_z) / ps_z) * 100
+        # One output buffer, updated in place (the interpolated traces are still plotted)
+        z_error = np.subtract(bp_z_interp, ps_z)
+        np.divide(z_error, ps_z, out=z_error)
+        np.multiply(z_error, 100, out=z_error)
         phase_error = (bp_phase_interp - ps_phase)
 
-        # Print statistics
+        # Print statistics (computed once, reused for the plot boxes)
+        z_stats = error_stats(z_error)
+        phase_stats = error_stats(phase_error)
         print("\n=== Error Statistics ===")
         print(f"Magnitude Error:")
-        print(f"  Mean: {np.mean(z_error):.2f}%")
-        print(f"  Std:  {np.std(z_error):.2f}%")
-        print(f"  Max:  {np.max(np.abs(z_error)):.2f}%")
+        print(f"  Mean: {z_stats[0]:.2f}%")
+        print(f"  Std:  {z_stats[1]:.2f}%")
+        print(f"  Max:  {z_stats[2]:.2f}%")
         print(f"\nPhase Error:")
-        print(f"  Mean: {np.mean(phase_error):.2f} deg")
-        print(f"  Std:  {np.std(phase_error):.2f} deg")
-        print(f"  Max:  {np.max(np.abs(phase_error)):.2f} deg")
+        print(f"  Mean: {phase_stats[0]:.2f} deg")
+        print(f"  Std:  {phase_stats[1]:.2f} deg")
+        print(f"  Max:  {phase_stats[2]:.2f} deg")
 
         # Plot
-        self.plot_comparison(freq_common, ps_z, ps_phase, bp_z_interp, bp_phase_interp, z_error, phase_error)
+        self.plot_comparison(freq_common, ps_z, ps_phase, bp_z_interp, bp_phase_interp, z_error, phase_error,
+                             z_stats, phase_stats)
 
-    def plot_comparison(self, freq, ps_z, ps_phase, bp_z, bp_phase, z_error, phase_error):
+    def plot_comparison(self, freq, ps_z, ps_phase, bp_z, bp_phase, z_error, phase_error,
+                        z_stats=None, phase_stats=None):
         """Create comparison plots"""
-        fig = plt.figure(figsize=(14, 8))
-        fig.suptitle('Impedance Comparison: PalmSens vs BioPal', fontsize=16, fontweight='bold')
+        import matplotlib.pyplot as plt  # Imported here: slow, and only needed once data is loaded
 
-        # Create 2x2 subplot grid
+        # Create 2x2 subplot grid in one call
         # [0,0]: Magnitude comparison
         # [0,1]: Phase comparison
         # [1,0]: Magnitude error
         # [1,1]: Phase error
+        # Data artists are rasterized so vector exports (SVG/PDF) stay light
+        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(14, 8), constrained_layout=True)
+        fig.suptitle('Impedance Comparison: PalmSens vs BioPal', fontsize=16, fontweight='bold')
 
         # Magnitude comparison
-        ax1 = plt.subplot(2, 2, 1)
-        ax1.loglog(freq, ps_z, 'b-', label='PalmSens', linewidth=2, marker='o', markersize=4)
-        ax1.loglog(freq, bp_z, 'r--', label='BioPal', linewidth=2, marker='s', markersize=3)
+        ax1.loglog(freq, ps_z, 'b-', label='PalmSens', linewidth=2, marker='o', markersize=4, rasterized=True)
+        ax1.loglog(freq, bp_z, 'r--', label='BioPal', linewidth=2, marker='s', markersize=3, rasterized=True)
         ax1.set_xlabel('Frequency (Hz)', fontsize=11)
         ax1.set_ylabel('|Z| (Ω)', fontsize=11)
         ax1.set_title('Impedance Magnitude Comparison (Log-Log)', fontsize=12, fontweight='bold')
@@ -308,9 +460,8 @@ class ImpedanceComparison:
         ax1.legend(fontsize=10)
 
         # Phase comparison
-        ax2 = plt.subplot(2, 2, 2)
-        ax2.semilogx(freq, ps_phase, 'b-', label='PalmSens', linewidth=2, marker='o', markersize=4)
-        ax2.semilogx(freq, bp_phase, 'r--', label='BioPal', linewidth=2, marker='s', markersize=3)
+        ax2.semilogx(freq, ps_phase, 'b-', label='PalmSens', linewidth=2, marker='o', markersize=4, rasterized=True)
+        ax2.semilogx(freq, bp_phase, 'r--', label='BioPal', linewidth=2, marker='s', markersize=3, rasterized=True)
         ax2.set_xlabel('Frequency (Hz)', fontsize=11)
         ax2.set_ylabel('Phase (°)', fontsize=11)
         ax2.set_title('Phase Comparison', fontsize=12, fontweight='bold')
@@ -318,44 +469,38 @@ class ImpedanceComparison:
         ax2.legend(fontsize=10)
 
         # Magnitude error
-        ax3 = plt.subplot(2, 2, 3)
-        ax3.semilogx(freq, z_error, 'g-', linewidth=2, marker='o', markersize=4)
+        ax3.semilogx(freq, z_error, 'g-', linewidth=2, marker='o', markersize=4, rasterized=True)
         ax3.axhline(y=0, color='k', linestyle='--', alpha=0.5, linewidth=1)
-        ax3.fill_between(freq, 0, z_error, alpha=0.3, color='green')
+        ax3.fill_between(freq, 0, z_error, alpha=0.3, color='green', rasterized=True)
         ax3.set_xlabel('Frequency (Hz)', fontsize=11)
         ax3.set_ylabel('Error (%)', fontsize=11)
         ax3.set_title('Magnitude Error (BioPal - PalmSens)', fontsize=12, fontweight='bold')
         ax3.grid(True, which='both', alpha=0.3)
 
         # Add statistics box
-        mean_z_err = np.mean(z_error)
-        std_z_err = np.std(z_error)
-        max_z_err = np.max(np.abs(z_error))
+        mean_z_err, std_z_err, max_z_err = z_stats if z_stats is not None else error_stats(z_error)
         stats_text = f'Mean: {mean_z_err:.2f}%\nStd: {std_z_err:.2f}%\nMax: {max_z_err:.2f}%'
         ax3.text(0.02, 0.98, stats_text, transform=ax3.transAxes,
                 verticalalignment='top', fontsize=9,
                 bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
 
         # Phase error
-        ax4 = plt.subplot(2, 2, 4)
-        ax4.semilogx(freq, phase_error, 'm-', linewidth=2, marker='o', markersize=4)
+        ax4.semilogx(freq, phase_error, 'm-', linewidth=2, marker='o', markersize=4, rasterized=True)
         ax4.axhline(y=0, color='k', linestyle='--', alpha=0.5, linewidth=1)
-        ax4.fill_between(freq, 0, phase_error, alpha=0.3, color='magenta')
+        ax4.fill_between(freq, 0, phase_error, alpha=0.3, color='magenta', rasterized=True)
         ax4.set_xlabel('Frequency (Hz)', fontsize=11)
         ax4.set_ylabel('Error (deg)', fontsize=11)
         ax4.set_title('Phase Error (BioPal - PalmSens)', fontsize=12, fontweight='bold')
         ax4.grid(True, which='both', alpha=0.3)
 
         # Add statistics box
-        mean_phase_err = np.mean(phase_error)
-        std_phase_err = np.std(phase_error)
-        max_phase_err = np.max(np.abs(phase_error))
+        mean_phase_err, std_phase_err, max_phase_err = (phase_stats if phase_stats is not None
+                                                        else error_stats(phase_error))
         stats_text = f'Mean: {mean_phase_err:.2f} deg\nStd: {std_phase_err:.2f} deg\nMax: {max_phase_err:.2f} deg'
         ax4.text(0.02, 0.98, stats_text, transform=ax4.transAxes,
                 verticalalignment='top', fontsize=9,
                 bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
 
-        plt.tight_layout()
         plt.show()
 
 
@@ -372,6 +517,9 @@ def main():
         print("No command line arguments provided.")
         print("Opening file dialogues...\n")
 
+        import tkinter as tk
+        from tkinter import filedialog
+
         # Create hidden root window for file dialogues
         root = tk.Tk()
         root.withdraw()  # Hide the main window
@@ -8,9 +8,10 @@ Usage: python stm_to_impedance.py <input_csv>
 """
 
 import sys
-import csv
 import math
 import os
+import warnings
+import numpy as np
 
 # Calibration constants (from ESP32 calibration.cpp)
 V_GBW = 10.0  # Voltage stage Gain Bandwidth Product (MHz)
@@ -21,6 +22,13 @@ TIA_GAINS = [7500.0, 37.6]  # [high=0, low=1]
 PGA_CUTOFF = [10.0, 3.8, 1.8, 1.8, 1.3, 0.9, 0.38, 0.23]  # MHz
 PGA_GAIN_VALUES = [1, 2, 5, 10, 20, 50, 100, 200]
 
+# Derived per-stage constants (poles in Hz), indexed like the tables above
+V_POLE = V_GBW / V_GAIN * 1e6
+V_DC_GAIN = TLV_GAIN * V_GAIN
+I_POLE = tuple(I_GBW / g * 1e6 for g in TIA_GAINS)
+I_DC_GAIN = tuple(TLV_GAIN * g for g in TIA_GAINS)
+PGA_POLE = tuple(c * 1e6 for c in PGA_CUTOFF)
+
 
 def pga_enum_to_gain(pga_enum):
     """Convert PGA enum (0-7) to actual gain value"""
@@ -34,32 +42,18 @@ def get_calibration_point(freq_hz, tia_low, pga_gain_enum):
     Calculate calibration point for given frequency and gain settings
     Returns: (v_gain, i_gain, phase_offset)
     """
-    freq = float(freq_hz)
-
-    # Calculate voltage gain and phase shift
-    v_gain = TLV_GAIN * V_GAIN * (1 / math.sqrt(1 + pow(freq / (V_GBW / V_GAIN * 1e6), 2)))
-    v_phase = -math.atan(freq / (V_GBW / V_GAIN * 1e6)) * 180.0 / math.pi
-
-    # Calculate current gain and phase shift
-    tia_gain = TIA_GAINS[tia_low]
-    pga_gain = pga_enum_to_gain(pga_gain_enum)
-
-    i_gain = (TLV_GAIN * tia_gain * (1 / math.sqrt(1 + pow(freq / (I_GBW / tia_gain * 1e6), 2))) *
-              pga_gain * (1 / math.sqrt(1 + pow(freq / (PGA_CUTOFF[pga_gain_enum] * 1e6), 2))))
-
-    i_phase = (-math.atan(freq / (I_GBW / tia_gain * 1e6)) * 180.0 / math.pi -
-               math.atan(freq / (PGA_CUTOFF[pga_gain_enum] * 1e6)) * 180.0 / math.pi)
-
-    phase_offset = v_phase - i_phase
-
-    return v_gain, i_gain, phase_offset
+    v_gain, i_gain, phase_offset = calibration_points(float(freq_hz), tia_low, pga_gain_enum)
+    return float(v_gain), float(i_gain), float(phase_offset)
 
 
 def normalize_phase(phase):
     """Normalize phase to [-180, 180] range"""
-    while phase > 180.0:
+    # fmod is exact and leaves (-360, 360); one more turn at most (also exact).
+    # Unlike math.remainder this keeps 180 and -180 as they are
+    phase = math.fmod(phase, 360.0)
+    if phase > 180.0:
         phase -= 360.0
-    while phase < -180.0:
+    elif phase < -180.0:
         phase += 360.0
     return phase
 
@@ -94,84 +88,157 @@ def calibrate_and_calculate(v_mag, v_phase, i_mag, i_phase, freq_hz, pga_gain, t
     return Z_magnitude, Z_phase
 
 
-def parse_stm_csv(filepath):
+def normalize_phase_array(phase):
+    """Normalize an array of phases to [-180, 180] range (same result as normalize_phase)"""
+    phase = np.fmod(np.asarray(phase, dtype=np.float64), 360.0)
+    phase[phase > 180.0] -= 360.0
+    phase[phase < -180.0] += 360.0
+    return phase
+
+
+def calibration_points(freq_hz, tia_gain, pga_gain):
     """
-    Parse STM32 CSV format
-    Returns: list of (dut_num, freq, v_mag, v_phase, i_mag, i_phase, pga_gain, tia_gain, valid)
+    get_calibration_point over arrays of points
+    Returns: (v_gain, i_gain, phase_offset) arrays
     """
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
+    freq = np.asarray(freq_hz, dtype=np.float64)
+    pga_gain = np.asarray(pga_gain)
 
-    results = []
-    dut_num = 1
-    voltage_data = {}
-    current_data = {}
-
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-
-        # Check for DUT header
-        if line.startswith("========== DUT"):
-            parts = line.split()
-            if len(parts) >= 3:
-                dut_num = int(parts[2])
-
-        # Check for voltage section
-        elif line.startswith("DUT_") and "VOLTAGE" in line:
-            i += 1
-            # Parse voltage data
-            while i < len(lines):
-                line = lines[i].strip()
-                if line.startswith("DUT_") or line.startswith("="):
-                    break
-
-                parts = line.split(',')
-                if len(parts) >= 6:
-                    try:
-                        freq = int(parts[0])
-                        v_mag = int(parts[1])
-                        v_phase = int(parts[2])
-                        voltage_data[freq] = (v_mag, v_phase)
-                    except ValueError:
-                        pass
-                i += 1
-            continue
+    # Single-pole stage responses as complex transfer functions, so one abs()
+    # and one angle() give gain and phase shift of each path
+    h_v = V_DC_GAIN / (1.0 + 1j * (freq / V_POLE))
+
+    # Current path transfer function; out-of-range PGA enums use gain 1 (as
+    # pga_enum_to_gain) but still index PGA_POLE, so they raise IndexError
+    i_pole = np.asarray(I_POLE)[tia_gain]
+    pga_pole = np.asarray(PGA_POLE)[pga_gain]
+    in_range = (pga_gain >= 0) & (pga_gain < len(PGA_GAIN_VALUES))
+    pga = np.where(in_range, np.asarray(PGA_GAIN_VALUES)[np.where(in_range, pga_gain, 0)], 1)
+
+    h_i = ((np.asarray(I_DC_GAIN)[tia_gain] / (1.0 + 1j * (freq / i_pole))) *
+           (pga / (1.0 + 1j * (freq / pga_pole))))
+
+    v_gain = np.abs(h_v)
+    i_gain = np.abs(h_i)
+    phase_offset = np.degrees(np.angle(h_v) - np.angle(h_i))
+
+    return v_gain, i_gain, phase_offset
 
-        # Check for current section
-        elif line.startswith("DUT_") and "CURRENT" in line:
-            i += 1
-            # Parse current data
-            while i < len(lines):
-                line = lines[i].strip()
-                if line.startswith("DUT_") or line.startswith("="):
-                    break
-
-                parts = line.split(',')
-                if len(parts) >= 6:
-                    try:
-                        freq = int(parts[0])
-                        i_mag = int(parts[1])
-                        i_phase = int(parts[2])
-                        pga_gain = int(parts[3])
-                        tia_gain = int(parts[4])
-                        valid = int(parts[5])
-                        current_data[freq] = (i_mag, i_phase, pga_gain, tia_gain, valid)
-                    except ValueError:
-                        pass
-                i += 1
+
+def calibrate_and_calculate_vec(freq_hz, v_mag, v_phase, i_mag, i_phase, pga_gain, tia_gain):
+    """
+    calibrate_and_calculate over arrays of points
+    Returns: (Z_magnitude, Z_phase) arrays; both 0 where the calibrated current is 0
+    """
+    v_gain, i_gain, phase_offset = calibration_points(freq_hz, tia_gain, pga_gain)
+
+    # Apply calibration (convert from scaled integers to actual values)
+    v_calibrated = (np.asarray(v_mag) / 1000.0) / v_gain
+    i_calibrated = (np.asarray(i_mag) / 1000.0) / i_gain
+
+    # Phase difference from scaled ints, then phase calibration
+    phase_diff = normalize_phase_array(np.asarray(v_phase) / 100.0 - np.asarray(i_phase) / 100.0)
+    Z_phase = normalize_phase_array(phase_diff - phase_offset)
+
+    # Calculate impedance
+    no_current = i_calibrated == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Z_magnitude = v_calibrated / i_calibrated
+    Z_magnitude[no_current] = 0
+    Z_phase[no_current] = 0
+
+    return Z_magnitude, Z_phase
+
+
+def _parse_int_rows(lines, num_cols):
+    """First num_cols integer fields of each row; rows that don't parse are skipped"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # Empty data warning
+            return np.loadtxt(lines, delimiter=',', usecols=range(num_cols), dtype=np.int64,
+                              comments=None, ndmin=2)
+    except ValueError:
+        pass
+
+    # Fallback: row by row, dropping the rows int() rejects
+    rows = np.empty((len(lines), num_cols), dtype=np.int64)
+    n_valid = 0
+    for line in lines:
+        try:
+            rows[n_valid] = [int(part) for part in line.split(',', num_cols)[:num_cols]]
+        except ValueError:
             continue
+        n_valid += 1
+    return rows[:n_valid]
 
-        i += 1
 
-    # Combine voltage and current data
-    for freq in sorted(voltage_data.keys()):
-        if freq in current_data:
-            v_mag, v_phase = voltage_data[freq]
-            i_mag, i_phase, pga_gain, tia_gain, valid = current_data[freq]
-            results.append((dut_num, freq, v_mag, v_phase, i_mag, i_phase, pga_gain, tia_gain, valid))
+def parse_stm_csv(filepath):
+    """
+    Parse STM32 CSV format
+    Returns: dict of int64 arrays, one entry per frequency point:
+             dut, freq, v_mag, v_phase, i_mag, i_phase, pga_gain, tia_gain, valid
+    """
+    dut_num = 1
+    voltage_lines = []  # freq, v_mag, v_phase, ...
+    current_lines = []  # freq, i_mag, i_phase, pga_gain, tia_gain, valid
+    section = None  # None, 'V' or 'I'
 
-    return results
+    # Single streaming pass; a section ends at the next "DUT_" or "=" line,
+    # which is then handled as a header
+    with open(filepath, 'r') as f:
+        for line in f:
+            line = line.strip()
+            # Headers start with 'D' or '='; data rows start with a digit, so
+            # one character compare rules them out before any startswith
+            first = line[:1]
+
+            if section is not None:
+                if not (first == '=' or (first == 'D' and line.startswith("DUT_"))):
+                    # Rows need 6 fields; they are converted per section below
+                    if line.count(',') >= 5:
+                        (voltage_lines if section == 'V' else current_lines).append(line)
+                    continue
+                section = None
+
+            # Check for DUT header
+            if first == '=':
+                if line.startswith("========== DUT"):
+                    parts = line.split()
+                    if len(parts) >= 3:
+                        dut_num = int(parts[2])
+
+            # Check for voltage / current section
+            elif first == 'D' and line.startswith("DUT_"):
+                if "VOLTAGE" in line:
+                    section = 'V'
+                elif "CURRENT" in line:
+                    section = 'I'
+
+    voltage = _parse_int_rows(voltage_lines, 3)
+    current = _parse_int_rows(current_lines, 6)
+
+    # Combine voltage and current data by frequency. Usually both sections list
+    # the same increasing frequencies, so they pair up by index; otherwise
+    # merge by frequency (last row wins) like a dict join
+    if not (len(voltage) == len(current) and np.array_equal(voltage[:, 0], current[:, 0]) and
+            np.all(np.diff(voltage[:, 0]) > 0)):
+        voltage_index = {freq: k for k, freq in enumerate(voltage[:, 0].tolist())}
+        current_index = {freq: k for k, freq in enumerate(current[:, 0].tolist())}
+        freqs = [freq for freq in sorted(voltage_index) if freq in current_index]
+        voltage = voltage[[voltage_index[freq] for freq in freqs]].reshape(-1, 3)
+        current = current[[current_index[freq] for freq in freqs]].reshape(-1, 6)
+
+    return {
+        'dut': np.full(len(voltage), dut_num, dtype=np.int64),
+        'freq': voltage[:, 0],
+        'v_mag': voltage[:, 1],
+        'v_phase': voltage[:, 2],
+        'i_mag': current[:, 1],
+        'i_phase': current[:, 2],
+        'pga_gain': current[:, 3],
+        'tia_gain': current[:, 4],
+        'valid': current[:, 5]
+    }
 
 
 def main():
@@ -192,18 +259,19 @@ def main():
     # Parse STM32 data
     print("Parsing STM32 CSV data...")
     data = parse_stm_csv(input_file)
-    print(f"  ✓ Parsed {len(data)} frequency points")
+    print(f"  ✓ Parsed {len(data['freq'])} frequency points")
 
-    # Calculate impedance
+    # Calculate impedance for all valid points at once
     print("Applying calibration and calculating impedance...")
-    results = []
-
-    for dut_num, freq, v_mag, v_phase, i_mag, i_phase, pga_gain, tia_gain, valid in data:
-        if valid:
-            Z_mag, Z_phase = calibrate_and_calculate(v_mag, v_phase, i_mag, i_phase,
-                                                      freq, pga_gain, tia_gain)
-            results.append((dut_num, freq, Z_mag, Z_phase))
-            print(f"  Freq={freq:6d} Hz: |Z|={Z_mag:8.2f} Ω, Phase={Z_phase:7.2f}°")
+    valid = data['valid'] != 0
+    freqs = data['freq'][valid]
+    Z_mags, Z_phases = calibrate_and_calculate_vec(freqs, data['v_mag'][valid], data['v_phase'][valid],
+                                                   data['i_mag'][valid], data['i_phase'][valid],
+                                                   data['pga_gain'][valid], data['tia_gain'][valid])
+    results = list(zip(data['dut'][valid].tolist(), freqs.tolist(), Z_mags.tolist(), Z_phases.tolist()))
+    # One write for the whole table rather than a print per point
+    sys.stdout.write("".join([f"  Freq={freq:6d} Hz: |Z|={Z_mag:8.2f} Ω, Phase={Z_phase:7.2f}°\n"
+                              for dut_num, freq, Z_mag, Z_phase in results]))
 
     # Create Results directory if it doesn't exist
     os.makedirs("Results", exist_ok=True)
@@ -212,12 +280,11 @@ def main():
     output_file = "Results/ESP.csv"
     print(f"\nSaving results to {output_file}...")
 
+    # Plain numeric fields need no CSV quoting; \r\n rows as csv.writer wrote them
+    rows = ["DUT,Frequency_Hz,Magnitude_Ohms,Phase_Deg"]
+    rows += [f"{dut_num},{freq},{Z_mag:.6f},{Z_phase:.2f}" for dut_num, freq, Z_mag, Z_phase in results]
     with open(output_file, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['DUT', 'Frequency_Hz', 'Magnitude_Ohms', 'Phase_Deg'])
-
-        for dut_num, freq, Z_mag, Z_phase in results:
-            writer.writerow([dut_num, freq, f"{Z_mag:.6f}", f"{Z_phase:.2f}"])
+        f.write("\r\n".join(rows) + "\r\n")
 
     print(f"  ✓ Saved {len(results)} results to {output_file}")
     print("\nDone!")
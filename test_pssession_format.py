@@ -5,25 +5,60 @@ Creates a sample .pssession file and verifies it can be parsed
 """
 
 import json
-import math
 from datetime import datetime
+import numpy as np
+
+# Optional: faster JSON encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Shared, read-only pieces of the session JSON
+IDC_ZERO_POINT = {"v": 0.0, "c": 3, "s": 0}
+POTENTIAL_ZERO_POINT = {"v": 0.0, "s": 0, "r": 3}
+TIME_POINT = {"v": 0.0001}
+
+UNIT_MICROAMPERE = {"type": "PalmSens.Units.MicroAmpere", "s": "A", "q": "Current", "a": "i"}
+UNIT_VOLT = {"type": "PalmSens.Units.Volt", "s": "V", "q": "Potential", "a": "E"}
+UNIT_TIME = {"type": "PalmSens.Units.Time", "s": "s", "q": "Time", "a": "t"}
+UNIT_HERTZ = {"type": "PalmSens.Units.Hertz", "s": "Hz", "q": "Frequency", "a": "f"}
+UNIT_ZRE = {"type": "PalmSens.Units.ZRe", "s": "Ω", "q": "Z'", "a": "Z"}
+UNIT_ZIM = {"type": "PalmSens.Units.ZIm", "s": "Ω", "q": "-Z''", "a": "Z"}
+UNIT_Z = {"type": "PalmSens.Units.Z", "s": "Ω", "q": "Z", "a": "Z"}
+UNIT_PHASE = {"type": "PalmSens.Units.Phase", "s": "°", "q": "-Phase", "a": "Phase"}
+
+# Dataset arrays: (type, arraytype, description, unit, datavaluetype)
+VALUE_ARRAY_SPECS = (
+    ("PalmSens.Data.DataArrayCurrents", 2, "Idc", UNIT_MICROAMPERE,
+     "PalmSens.Data.DataValue.DataValueCurrentRange"),
+    ("PalmSens.Data.DataArrayPotentials", 1, "potential", UNIT_VOLT,
+     "PalmSens.Data.DataValue.DataValueGainRange"),
+    ("PalmSens.Data.DataArrayTime", 0, "time", UNIT_TIME, "PalmSens.Data.DataValue.DataValue"),
+    ("PalmSens.Data.DataArray", 5, "Frequency", UNIT_HERTZ, "PalmSens.Data.DataValue.DataValue"),
+    ("PalmSens.Data.DataArray", 7, "ZRe", UNIT_ZRE, "PalmSens.Data.DataValue.DataValue"),
+    ("PalmSens.Data.DataArray", 8, "ZIm", UNIT_ZIM, "PalmSens.Data.DataValue.DataValue"),
+    ("PalmSens.Data.DataArray", 10, "Z", UNIT_Z, "PalmSens.Data.DataValue.DataValue"),
+    ("PalmSens.Data.DataArray", 6, "Phase", UNIT_PHASE, "PalmSens.Data.DataValue.DataValue"),
+    ("PalmSens.Data.DataArrayCurrents", 9, "Iac", UNIT_MICROAMPERE,
+     "PalmSens.Data.DataValue.DataValueCurrentRange"),
+)
+
+def sweep_arrays(num_points, amplitude_v):
+    """Sample sweep as arrays: (freqs, mags, phases, z_re, z_im, i_ac)"""
+    freqs = 10 ** (np.arange(num_points) / 3.0)
+    mags = 10000 / (1 + freqs / 100)
+    phases = np.full(num_points, -45)
+    phase_rad = np.radians(phases)
+    i_ac = np.divide(amplitude_v, mags, out=np.zeros(num_points), where=mags > 0) * 1e6
+    return freqs, mags, phases, mags * np.cos(phase_rad), mags * np.sin(phase_rad), i_ac
 
 def create_test_pssession():
     """Create a test .pssession file with sample data"""
 
-    # Sample impedance data (frequency sweep from 1 Hz to 100 kHz)
-    test_data = []
-    for i in range(10):
-        freq = 10 ** (i / 3.0)  # Log-spaced frequencies
-        mag = 10000 / (1 + freq/100)  # Decreasing impedance
-        phase = -45  # -45 degrees
-
-        test_data.append({
-            'dut': 1,
-            'frequency': freq,
-            'magnitude': mag,
-            'phase': phase
-        })
+    # Sample impedance data (frequency sweep from 1 Hz to 100 kHz), as arrays
+    num_points = 10
+    freqs, mags, phases, z_re, z_im, i_ac = sweep_arrays(num_points, amplitude_v=0.01)
 
     # Create method string
     method_str = f"""#PSTrace, Version=5.8.1704.29098
@@ -32,9 +67,9 @@ def create_test_pssession():
 #TECHNIQUE=14
 #NOTES=BioPal ESP32 Test Measurement
 #Frequency range
-FREQ_START={test_data[0]['frequency']:.3E}
-FREQ_END={test_data[-1]['frequency']:.3E}
-NUM_FREQS={len(test_data)}
+FREQ_START={freqs[0]:.3E}
+FREQ_END={freqs[-1]:.3E}
+NUM_FREQS={num_points}
 AMPLITUDE=1.000E-002
 """
 
@@ -45,114 +80,35 @@ AMPLITUDE=1.000E-002
         "measurements": []
     }
 
-    # Build data arrays
-    freq_datavalues = []
-    z_re_datavalues = []
-    z_im_datavalues = []
-    z_mag_datavalues = []
-    z_phase_datavalues = []
-    idc_datavalues = []
-    potential_datavalues = []
-    time_datavalues = []
-    iac_datavalues = []
-
-    for point in test_data:
-        freq = point['frequency']
-        mag = point['magnitude']
-        phase_deg = point['phase']
-        phase_rad = math.radians(phase_deg)
-
-        z_re = mag * math.cos(phase_rad)
-        z_im = mag * math.sin(phase_rad)
-
-        amplitude_v = 0.01
-        i_ac = (amplitude_v / mag) * 1e6 if mag > 0 else 0
-
-        freq_datavalues.append({"v": freq})
-        z_re_datavalues.append({"v": z_re})
-        z_im_datavalues.append({"v": z_im})
-        z_mag_datavalues.append({"v": mag})
-        z_phase_datavalues.append({"v": phase_deg})
-        idc_datavalues.append({"v": 0.0, "c": 3, "s": 0})
-        potential_datavalues.append({"v": 0.0, "s": 0, "r": 3})
-        time_datavalues.append({"v": 0.0001})
-        iac_datavalues.append({"v": i_ac, "c": 3, "s": 0})
-
+    # Build data arrays (tolist() converts to Python numbers in one call)
+    freq_datavalues = [{"v": v} for v in freqs.tolist()]
+    z_re_datavalues = [{"v": v} for v in z_re.tolist()]
+    z_im_datavalues = [{"v": v} for v in z_im.tolist()]
+    z_mag_datavalues = [{"v": v} for v in mags.tolist()]
+    z_phase_datavalues = [{"v": v} for v in phases.tolist()]
+    # Constant points share one dict each; the encoder only reads them
+    idc_datavalues = [IDC_ZERO_POINT] * num_points
+    potential_datavalues = [POTENTIAL_ZERO_POINT] * num_points
+    time_datavalues = [TIME_POINT] * num_points
+    iac_datavalues = [{"v": v, "c": 3, "s": 0} for v in i_ac.tolist()]
+
+    # One datavalues list per entry of VALUE_ARRAY_SPECS, in the same order
+    datavalues = (idc_datavalues, potential_datavalues, time_datavalues, freq_datavalues,
+                  z_re_datavalues, z_im_datavalues, z_mag_datavalues, z_phase_datavalues,
+                  iac_datavalues)
     dataset = {
         "type": "PalmSens.Data.DataSetEIS",
         "values": [
             {
-                "type": "PalmSens.Data.DataArrayCurrents",
-                "arraytype": 2,
-                "description": "Idc",
-                "unit": {"type": "PalmSens.Units.MicroAmpere", "s": "A", "q": "Current", "a": "i"},
-                "datavalues": idc_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValueCurrentRange"
-            },
-            {
-                "type": "PalmSens.Data.DataArrayPotentials",
-                "arraytype": 1,
-                "description": "potential",
-                "unit": {"type": "PalmSens.Units.Volt", "s": "V", "q": "Potential", "a": "E"},
-                "datavalues": potential_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValueGainRange"
-            },
-            {
-                "type": "PalmSens.Data.DataArrayTime",
-                "arraytype": 0,
-                "description": "time",
-                "unit": {"type": "PalmSens.Units.Time", "s": "s", "q": "Time", "a": "t"},
-                "datavalues": time_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-            },
-            {
-                "type": "PalmSens.Data.DataArray",
-                "arraytype": 5,
-                "description": "Frequency",
-                "unit": {"type": "PalmSens.Units.Hertz", "s": "Hz", "q": "Frequency", "a": "f"},
-                "datavalues": freq_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-            },
-            {
-                "type": "PalmSens.Data.DataArray",
-                "arraytype": 7,
-                "description": "ZRe",
-                "unit": {"type": "PalmSens.Units.ZRe", "s": "Ω", "q": "Z'", "a": "Z"},
-                "datavalues": z_re_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-            },
-            {
-                "type": "PalmSens.Data.DataArray",
-                "arraytype": 8,
-                "description": "ZIm",
-                "unit": {"type": "PalmSens.Units.ZIm", "s": "Ω", "q": "-Z''", "a": "Z"},
-                "datavalues": z_im_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-            },
-            {
-                "type": "PalmSens.Data.DataArray",
-                "arraytype": 10,
-                "description": "Z",
-                "unit": {"type": "PalmSens.Units.Z", "s": "Ω", "q": "Z", "a": "Z"},
-                "datavalues": z_mag_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-            },
-            {
-                "type": "PalmSens.Data.DataArray",
-                "arraytype": 6,
-                "description": "Phase",
-                "unit": {"type": "PalmSens.Units.Phase", "s": "°", "q": "-Phase", "a": "Phase"},
-                "datavalues": z_phase_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValue"
-            },
-            {
-                "type": "PalmSens.Data.DataArrayCurrents",
-                "arraytype": 9,
-                "description": "Iac",
-                "unit": {"type": "PalmSens.Units.MicroAmpere", "s": "A", "q": "Current", "a": "i"},
-                "datavalues": iac_datavalues,
-                "datavaluetype": "PalmSens.Data.DataValue.DataValueCurrentRange"
+                "type": array_type,
+                "arraytype": array_id,
+                "description": description,
+                "unit": unit,
+                "datavalues": values,
+                "datavaluetype": value_type
             }
+            for (array_type, array_id, description, unit, value_type), values
+            in zip(VALUE_ARRAY_SPECS, datavalues)
         ]
     }
 
@@ -172,18 +128,21 @@ AMPLITUDE=1.000E-002
 
     pssession["measurements"].append(measurement)
 
-    # Save file
+    # Save file: compact JSON (orjson when available), UTF-16 with BOM at
+    # start and end like PS Trace; encoded once and written as bytes
     filepath = "test_output.pssession"
-    json_str = json.dumps(pssession, indent=2)
+    if orjson is not None:
+        json_str = orjson.dumps(pssession).decode('utf-8')
+    else:
+        json_str = json.dumps(pssession, separators=(',', ':'), ensure_ascii=False)
+    payload = ('\ufeff' + json_str + '\ufeff').encode('utf-16-le')
 
-    with open(filepath, 'w', encoding='utf-16-le') as f:
-        f.write('\ufeff')
-        f.write(json_str)
-        f.write('\ufeff')
+    with open(filepath, 'wb') as f:
+        f.write(payload)
 
     print(f"✓ Created test file: {filepath}")
-    print(f"  File size: {len(json_str.encode('utf-16-le'))} bytes")
-    print(f"  Number of frequencies: {len(test_data)}")
+    print(f"  File size: {len(payload)} bytes")
+    print(f"  Number of frequencies: {num_points}")
     return filepath
 
 def verify_pssession(filepath):
@@ -191,16 +150,18 @@ def verify_pssession(filepath):
     print(f"\nVerifying: {filepath}")
 
     try:
-        with open(filepath, 'r', encoding='utf-16-le') as f:
-            content = f.read()
+        with open(filepath, 'rb') as f:
+            raw = f.read()
 
-        # Strip BOM
-        if content.startswith('\ufeff'):
-            content = content[1:]
+        # Skip the BOM bytes and decode once (the memoryview avoids a copy)
+        start = 2 if raw[:2] == b'\xff\xfe' else 0
+        content = str(memoryview(raw)[start:], 'utf-16-le')
 
-        # Parse just the first JSON object
+        # Parse just the first JSON object (a BOM also follows it)
         decoder = json.JSONDecoder()
         data, idx = decoder.raw_decode(content)
+        if not isinstance(data, dict):
+            raise ValueError("top-level JSON value is not an object")
 
         print(f"✓ Successfully parsed JSON")
         print(f"  Type: {data.get('type')}")
@@ -229,10 +190,9 @@ def verify_pssession(filepath):
         print("\n✓ File format is valid!")
         return True
 
-    except Exception as e:
+    except (OSError, ValueError) as e:
+        # Unreadable file, bad encoding or invalid JSON; anything else is a bug and raises
         print(f"✗ Error: {e}")
-        import traceback
-        traceback.print_exc()
         return False
 
 if __name__ == "__main__":